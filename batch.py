@@ -0,0 +1,125 @@
+import contextlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import profiling
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+def _init_worker(profile_memory=None):
+    # Workers only ever write image files: force the non-interactive backend,
+    # without importing matplotlib in workers that never plot
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use('Agg')
+    else:
+        os.environ['MPLBACKEND'] = 'Agg'
+    # Workers record stages but leave the log to the parent
+    if profile_memory is not None:
+        profiling.enable(memory=profile_memory)
+
+
+def _run_task(func, args):
+    """
+    Run one task, capturing what it prints so the parent can replay the output
+    in input order. Returns (ok, output, error, elapsed, value, profile) where
+    profile is (stages, cpu, max_rss_mb) of the task while profiling is
+    enabled, else None.
+    """
+    out = io.StringIO()
+    profile = None
+    if profiling.is_enabled():
+        profiling.collect()
+        cpu = time.process_time()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            value = func(*args)
+        ok, error = True, None
+    except Exception as e:
+        value, ok, error = None, False, f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - start
+    if profiling.is_enabled():
+        profile = profiling.collect(), time.process_time() - cpu, profiling.max_rss_mb()
+    return ok, out.getvalue(), error, elapsed, value, profile
+
+
+def run_batch(func, tasks, jobs=None, message="Processing", results=None):
+    """
+    Run func(*args) for every (name, args) in `tasks` over `jobs` worker
+    processes (default: CPU count; 1 runs in this process). Output is printed
+    in task order whatever the completion order, a failing file is reported and
+    skipped, and a throughput summary is printed at the end. If a worker dies
+    (e.g. killed when out of memory) its task and every task still pending in
+    the broken pool are reported as failed.
+
+    Returns the list of (name, error) for the failed tasks. If `results` is a
+    list, (name, return value) of every successful task is appended to it, in
+    task order.
+
+    While profiling is enabled (profiling.enable), every task is logged with
+    its stages, the workers included (see profiling.summary).
+    """
+    jobs = default_jobs() if jobs is None else max(1, jobs)
+    jobs = min(jobs, max(1, len(tasks)))
+    failures = []
+    start = time.perf_counter()
+
+    def report(name, result):
+        ok, output, error, elapsed, value, profile = result
+        print(f"{message}: {name}")
+        if output:
+            print(output, end='')
+        if ok and results is not None:
+            results.append((name, value))
+        if not ok:
+            print(f"Error: {name}: {error}")
+            failures.append((name, error))
+        if profile:
+            profiling.log_file(name, profile[0], elapsed, profile[1], profile[2])
+
+    if jobs == 1:
+        for name, args in tasks:
+            report(name, _run_task(func, args))
+    else:
+        profile_memory = profiling.memory_enabled() if profiling.is_enabled() else None
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(profile_memory,)) as executor:
+            futures = [(name, executor.submit(_run_task, func, args)) for name, args in tasks]
+            for name, future in futures:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # BrokenProcessPool, or a result that could not be sent back
+                    result = False, '', f"{type(e).__name__}: {e}", 0.0, None, None
+                report(name, result)
+
+    elapsed = time.perf_counter() - start
+    rate = len(tasks) / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {len(tasks)} files in {elapsed:.1f}s ({rate:.2f} files/s, {jobs} jobs), "
+          f"{len(failures)} failed")
+    for name, error in failures:
+        print(f"  {name}: {error}")
+    return failures
+
+
+# Help of the options added by add_batch_arguments; spectrum.py passes its own in Italian
+BATCH_HELP = {
+    'jobs': 'Number of files processed in parallel (default: CPU count)',
+    'incremental': 'Only process files that are new or changed since the last run into the output folder, or all '
+                   'of them if the settings changed, and remove the outputs of deleted files',
+    'watch': 'Keep running and process files as they arrive or change in the input folder (implies --incremental)',
+    'interval': 'Seconds between checks of the input folder with --watch (default: 2)',
+}
+
+
+def add_batch_arguments(parser, help=BATCH_HELP, incremental=True):
+    """--jobs and, for tools that keep an output folder up to date, --incremental, --watch and --interval."""
+    parser.add_argument('--jobs', type=int, default=default_jobs(), help=help['jobs'])
+    if incremental:
+        parser.add_argument('--incremental', action='store_true', help=help['incremental'])
+        parser.add_argument('--watch', action='store_true', help=help['watch'])
+        parser.add_argument('--interval', type=float, default=2, help=help['interval'])
@@ -0,0 +1,294 @@
+import argparse
+import json
+import os
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import profiling
+
+SIGNALS = ['sweep', 'pink', 'correlated', 'decorrelated']
+SAMPLE_FORMATS = ['int16', 'int32', 'float32']
+TOOLS = ['mono', 'stereo', 'spectrum', 'stereoscope']
+
+# Paul Kellet's pink noise filter: -3 dB/octave within 0.05 dB above 10 Hz
+PINK_B = [0.049922035, -0.095993537, 0.050612699, -0.004408786]
+PINK_A = [1, -2.494956002, 2.017265875, -0.522189400]
+
+
+def write_wav(path, fs, channels, sample_format, n_frames, blocks):
+    """
+    Stream float blocks (frames, channels) in [-1, 1] to a WAV file as int16,
+    int32 or float32, so a corpus file never has to fit in memory.
+    """
+    dtype, format_tag = {'int16': ('<i2', 1), 'int32': ('<i4', 1), 'float32': ('<f4', 3)}[sample_format]
+    width = np.dtype(dtype).itemsize
+    data_size = n_frames * channels * width
+    with open(path, 'wb') as fid:
+        fid.write(b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE')
+        fid.write(b'fmt ' + struct.pack('<IHHIIHH', 16, format_tag, channels, fs, fs * channels * width,
+                                        channels * width, 8 * width))
+        fid.write(b'data' + struct.pack('<I', data_size))
+        for block in blocks:
+            if sample_format == 'float32':
+                samples = block.astype(dtype)
+            else:
+                full_scale = np.iinfo(dtype).max
+                samples = np.clip(np.round(block * full_scale), -full_scale - 1, full_scale).astype(dtype)
+            fid.write(samples.tobytes())
+
+
+def synth_blocks(signal, fs, n_frames, block_size=10, seed=0):
+    """
+    Yield the synthetic `signal` as float blocks of `block_size` seconds:
+    - sweep: exponential sine sweep 20 Hz - 20 kHz over the whole length, -6 dBFS, same on both channels
+    - pink: mono pink noise
+    - correlated: stereo pink noise with an inter-channel correlation of 0.8
+    - decorrelated: independent pink noise on each channel
+    """
+    from scipy.signal import lfilter
+
+    rng = np.random.default_rng(seed)
+    n_noise = {'sweep': 0, 'pink': 1, 'correlated': 2, 'decorrelated': 2}[signal]
+    state = [np.zeros(len(PINK_A) - 1) for _ in range(n_noise)]
+    duration = n_frames / fs
+    rate = np.log(20000 / 20)
+    block = max(1, int(block_size * fs))
+
+    for start in range(0, n_frames, block):
+        n = min(block, n_frames - start)
+        if signal == 'sweep':
+            t = (start + np.arange(n)) / fs
+            phase = 2 * np.pi * 20 * duration / rate * (np.exp(t * rate / duration) - 1)
+            tone = 0.5 * np.sin(phase)
+            yield np.column_stack([tone, tone])
+            continue
+        noise = []
+        for i in range(n_noise):
+            pink, state[i] = lfilter(PINK_B, PINK_A, 0.1 * rng.standard_normal(n), zi=state[i])
+            noise.append(pink)
+        if signal == 'correlated':
+            noise[1] = 0.8 * noise[0] + 0.6 * noise[1]
+        yield np.clip(np.column_stack(noise), -1, 1)
+
+
+def make_corpus(folder, signals=SIGNALS, rates=(44100, 48000, 96000), formats=SAMPLE_FORMATS, lengths=(10,)):
+    """Write the synthetic corpus into `folder`, reusing files that already exist. Returns their paths."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for seconds in lengths:
+        for signal in signals:
+            for fs in rates:
+                for sample_format in formats:
+                    path = os.path.join(folder, f"{signal}_{fs}_{sample_format}_{seconds:g}s.wav")
+                    if not os.path.exists(path):
+                        n_frames = int(seconds * fs)
+                        channels = 1 if signal == 'pink' else 2
+                        tmp = path + '.tmp'
+                        write_wav(tmp, fs, channels, sample_format, n_frames,
+                                  synth_blocks(signal, fs, n_frames, seed=SIGNALS.index(signal)))
+                        os.replace(tmp, path)
+                    paths.append(path)
+    return paths
+
+
+def run_tool(tool, path, output_folder, dpi=300, **analyzer_options):
+    """Run the real per-file function of `tool` on `path`, exactly as its CLI would."""
+    import contextlib
+    import io
+    name = os.path.splitext(os.path.basename(path))[0]
+    output_file = os.path.join(output_folder, f"{tool}_{name}.png")
+    with contextlib.redirect_stdout(io.StringIO()):
+        if tool == 'mono':
+            import monofolderspec
+            monofolderspec.analyze_audio_file(path, output_file, dpi=dpi, **analyzer_options)
+        elif tool == 'stereo':
+            import stereofolderspec
+            stereofolderspec.analyze_audio_file(path, output_file, dpi=dpi, **analyzer_options)
+        elif tool == 'spectrum':
+            import spectrum
+            spectrum.compare_audio_files(path, path, output_file, dpi=dpi, **analyzer_options)
+        else:
+            from stereofolderscope import analyze_stereo_file
+            analyze_stereo_file(path, output_file, dpi=dpi)
+
+
+def reference_spectra(paths, **analyzer_options):
+    """The mono and per-channel spectra of every file, keyed by file name."""
+    from spectrumengine import get_analyzer
+    analyzer = get_analyzer(**analyzer_options)
+    spectra = {}
+    for path in paths:
+        name = os.path.basename(path)
+        spectra[f"{name}:mono"] = analyzer.analyze(path)[1]
+        spectra[f"{name}:channels"] = analyzer.analyze(path, downmix=False)[1]
+    return analyzer.freq, spectra
+
+
+def compare_spectra(freq, spectra, reference_file, floor_db=None):
+    """
+    Largest |dB| difference per curve against a saved reference over the
+    plotted band, 20 Hz to 24 kHz, ignoring the points where the reference is
+    below `floor_db`.
+    """
+    reference = np.load(reference_file)
+    band = (freq >= 20) & (freq <= 24000)
+    errors = {}
+    for key, dbfs in spectra.items():
+        if key not in reference.files:
+            continue
+        expected = reference[key]
+        if expected.shape != dbfs.shape:
+            errors[key] = float('inf')
+            continue
+        error = np.abs(dbfs[..., band] - expected[..., band])
+        if floor_db is not None:
+            error = error[expected[..., band] >= floor_db]
+        errors[key] = float(np.max(error, initial=0.0))
+    return errors
+
+
+def environment():
+    versions = {'python': platform.python_version(), 'numpy': np.__version__}
+    for module in ['scipy', 'matplotlib']:
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            pass
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'platform': platform.platform(), 'cpus': os.cpu_count(), 'versions': versions}
+
+
+def add_stages(total, stages):
+    """Add the stages recorded by profiling.collect() into `total`, keeping the largest peak."""
+    for name, entry in stages.items():
+        summed = total.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+        summed['wall'] += entry['wall']
+        summed['cpu'] += entry['cpu']
+        summed['calls'] += entry['calls']
+        if 'peak_mb' in entry:
+            summed['peak_mb'] = max(summed.get('peak_mb', 0.0), entry['peak_mb'])
+
+
+def benchmark(paths, tools=TOOLS, repeat=1, dpi=300, **analyzer_options):
+    """
+    Time every tool end to end on every file (best of `repeat`) and break the
+    fastest run down into the stages the tools record through profiling. A
+    second, traced pass measures each stage's peak allocation, so tracing does
+    not distort the times. Returns the results dict.
+    """
+    from wavsegment import read_wav_info
+
+    results = {}
+    for tool in tools:
+        files = [path for path in paths if tool != 'stereoscope' or read_wav_info(path).channels > 1]
+        if not files:
+            continue
+        audio_seconds = sum(read_wav_info(path).duration for path in files)
+        per_file = {}
+        stages = {}
+        with tempfile.TemporaryDirectory() as folder:
+            profiling.enable()
+            # Warm-up: imports, figure templates, FFT plans
+            run_tool(tool, files[0], folder, dpi, **analyzer_options)
+            for path in files:
+                best, best_stages = float('inf'), None
+                for _ in range(repeat):
+                    profiling.collect()
+                    start = time.perf_counter()
+                    run_tool(tool, path, folder, dpi, **analyzer_options)
+                    elapsed = time.perf_counter() - start
+                    if elapsed < best:
+                        best, best_stages = elapsed, profiling.collect()
+                per_file[os.path.basename(path)] = best
+                add_stages(stages, best_stages)
+
+            profiling.enable(memory=True)
+            traced = {}
+            for path in files:
+                profiling.collect()
+                run_tool(tool, path, folder, dpi, **analyzer_options)
+                add_stages(traced, profiling.collect())
+            profiling.disable()
+        for name, entry in stages.items():
+            entry['peak_mb'] = traced.get(name, {}).get('peak_mb', 0.0)
+        wall = sum(per_file.values())
+
+        results[tool] = {
+            'files': len(files),
+            'audio_seconds': audio_seconds,
+            'wall': wall,
+            'files_per_second': len(files) / wall if wall > 0 else 0.0,
+            'audio_seconds_per_second': audio_seconds / wall if wall > 0 else 0.0,
+            'stages': stages,
+            'per_file': per_file,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the analysis tools on a synthetic WAV corpus and write the results as JSON')
+    parser.add_argument('corpus_folder', type=str, help='Folder for the synthetic corpus; files already there are reused')
+    parser.add_argument('output_json', type=str, help='Path of the JSON results file')
+    parser.add_argument('--signals', type=str, default=','.join(SIGNALS),
+                        help='Comma-separated signals to generate: sweep, pink, correlated, decorrelated (default: all)')
+    parser.add_argument('--rates', type=str, default='44100,48000,96000', help='Comma-separated sample rates (default: 44100,48000,96000)')
+    parser.add_argument('--formats', type=str, default=','.join(SAMPLE_FORMATS),
+                        help='Comma-separated sample formats: int16, int32, float32 (default: all)')
+    parser.add_argument('--lengths', type=str, default='10', help='Comma-separated file lengths in seconds, e.g. 10,60,3600 (default: 10)')
+    parser.add_argument('--tools', type=str, default=','.join(TOOLS),
+                        help='Comma-separated tools to time: mono, stereo, spectrum, stereoscope (default: all)')
+    parser.add_argument('--repeat', type=int, default=1, help='End-to-end runs per file, the fastest is kept (default: 1)')
+    parser.add_argument('--dpi', type=int, default=300, help='DPI of the rendered plots (default: 300)')
+    parser.add_argument('--mode', choices=['single', 'welch'], default='single',
+                        help='Spectrum analysis mode of the runs and of the accuracy check (default: single)')
+    parser.add_argument('--precision', choices=['float64', 'float32'], default='float64',
+                        help='Numeric precision of the spectrum analysis (default: float64)')
+    parser.add_argument('--reference', type=str, help='Compare the spectra with this reference .npz and fail above --tolerance')
+    parser.add_argument('--save-reference', type=str, help='Save the current spectra as a reference .npz')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Largest accepted difference from the reference in dB (default: 0.01)')
+    parser.add_argument('--floor', type=float,
+                        help='Ignore points where the reference is below this many dBFS, e.g. -120 to check float32 '
+                             'against a float64 reference (default: compare every point)')
+
+    args = parser.parse_args()
+    paths = make_corpus(args.corpus_folder, args.signals.split(','), [int(r) for r in args.rates.split(',')],
+                        args.formats.split(','), [float(s) for s in args.lengths.split(',')])
+    print(f"Corpus: {len(paths)} files in {args.corpus_folder}")
+
+    analyzer_options = {'mode': args.mode, 'precision': args.precision}
+    results = {'environment': environment(),
+               'settings': {'mode': args.mode, 'precision': args.precision, 'dpi': args.dpi, 'repeat': args.repeat, 'files': [os.path.basename(p) for p in paths]},
+               'tools': benchmark(paths, args.tools.split(','), args.repeat, args.dpi, **analyzer_options)}
+    for tool, result in results['tools'].items():
+        slowest = max(result['stages'].items(), key=lambda item: item[1]['wall'])
+        print(f"{tool}: {result['files_per_second']:.2f} files/s, {result['audio_seconds_per_second']:.1f} audio s/s, "
+              f"slowest stage {slowest[0]} ({slowest[1]['wall']:.2f}s)")
+
+    failed = False
+    if args.reference or args.save_reference:
+        freq, spectra = reference_spectra(paths, **analyzer_options)
+        if args.save_reference:
+            np.savez_compressed(args.save_reference, freq=freq, **spectra)
+            print(f"Reference spectra saved to {args.save_reference}")
+        if args.reference:
+            errors = compare_spectra(freq, spectra, args.reference, args.floor)
+            worst = max(errors.values()) if errors else 0.0
+            failed = worst > args.tolerance
+            results['accuracy'] = {'reference': args.reference, 'tolerance': args.tolerance, 'floor_db': args.floor,
+                                   'max_error_db': worst, 'errors_db': errors}
+            print(f"Accuracy: largest difference {worst:.4g} dB over {len(errors)} curves "
+                  f"({'FAILED' if failed else 'ok'}, tolerance {args.tolerance} dB)")
+
+    results['peak_rss_mb'] = profiling.max_rss_mb()
+    with open(args.output_json, 'w') as fid:
+        json.dump(results, fid, indent=2)
+    print(f"Results written to {args.output_json}")
+    sys.exit(1 if failed else 0)
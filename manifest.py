@@ -0,0 +1,230 @@
+import json
+import os
+import time
+from functools import partial
+from batch import run_batch
+from spectrumcache import file_digest
+
+MANIFEST_NAME = '.pynalizers-manifest.json'
+MANIFEST_VERSION = 1
+
+# While watching, inputs modified more recently than this may still be being copied in
+WATCH_SETTLE = 2.0
+
+# Analyzer options that change where results are cached, never the outputs themselves
+CACHE_OPTIONS = ('cache_dir', 'cache_size', 'cache_hash')
+
+
+class Manifest:
+    """
+    What an output folder was built from, stored as MANIFEST_NAME inside it.
+    For every task name it records the identity of each input file (size,
+    mtime and SHA-256), the parameters, the outputs written, and whether the
+    task failed.
+
+    A task is up to date when its parameters are unchanged, its outputs all
+    exist and every input is unchanged. An input whose mtime moved but whose
+    content did not (touch, copy) still counts as unchanged. The hash is only
+    computed for inputs whose size or mtime changed, so an unchanged folder
+    is checked without reading its files.
+    """
+    def __init__(self, output_folder):
+        self.folder = output_folder
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self.entries = {}
+        self.changed = False
+        self._identities = {}
+        try:
+            with open(self.path) as fid:
+                data = json.load(fid)
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data['entries']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def identity(self, path, previous=None):
+        stat = os.stat(path)
+        identity = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if previous and previous.get('sha256') and all(previous.get(k) == v for k, v in identity.items()):
+            # Same size and mtime: trust the hash recorded last time
+            identity['sha256'] = previous['sha256']
+        else:
+            identity['sha256'] = file_digest(path)
+        return identity
+
+    def _unchanged(self, old, new):
+        if old is None or old['size'] != new['size']:
+            return False
+        if 'sha256' in old and 'sha256' in new:
+            return old['sha256'] == new['sha256']
+        return old['mtime_ns'] == new['mtime_ns']
+
+    def is_current(self, name, inputs, outputs, params, retry_failed=True):
+        """
+        Whether task `name` can be skipped. The identities of its inputs are
+        remembered for record(), so a file that changes while it is being
+        processed is picked up on the next run.
+        """
+        entry = self.entries.get(name)
+        previous = entry['inputs'] if entry else {}
+        self._identities[name] = {path: self.identity(path, previous.get(path)) for path in map(os.path.abspath, inputs)}
+        if entry is None or entry['params'] != _normalise(params):
+            return False
+        if not all(self._unchanged(previous.get(path), identity)
+                   for path, identity in self._identities[name].items()):
+            return False
+        if entry.get('failed'):
+            current = not retry_failed
+        else:
+            current = all(os.path.exists(path) for path in outputs)
+        if current and entry['inputs'] != self._identities[name]:
+            # Touched but identical, or hashed for the first time: remember it to skip the hash next time
+            entry['inputs'] = self._identities[name]
+            self.changed = True
+        return current
+
+    def record(self, name, inputs, outputs, params, failed=False):
+        """
+        Remember that task `name` wrote `outputs`, or failed, and remove what
+        it had written before and no longer does (another --format, --no-plot).
+        A failed task keeps no output: whatever it or an earlier run left
+        behind is removed, so no stale plot passes for a result.
+        """
+        identities = self._identities.get(name) or {path: self.identity(path) for path in map(os.path.abspath, inputs)}
+        # Outputs relative to the folder, so it can be moved or reached by another path
+        outputs = [os.path.relpath(path, self.folder) for path in outputs]
+        previous = self.entries[name]['outputs'] if name in self.entries else []
+        if failed:
+            self._remove(previous + outputs)
+            outputs = []
+        else:
+            self._remove(path for path in previous if path not in outputs)
+        self.entries[name] = {'inputs': identities, 'params': _normalise(params), 'outputs': outputs, 'failed': failed}
+        self.changed = True
+
+    def prune(self, names):
+        """
+        Forget every task not in `names` (its inputs were deleted) and remove
+        the outputs it had written. Returns the pruned task names.
+        """
+        pruned = [name for name in self.entries if name not in names]
+        self.changed |= bool(pruned)
+        for name in pruned:
+            self._remove(self.entries.pop(name)['outputs'])
+        return pruned
+
+    def _remove(self, outputs):
+        for path in outputs:
+            try:
+                os.remove(os.path.join(self.folder, path))
+            except OSError:
+                pass
+
+    def save(self):
+        # Write then rename, so an interrupted save never leaves half a manifest
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as fid:
+                json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, fid, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+def output_params(**params):
+    """The settings that determine a folder's outputs: `params` without the cache options."""
+    return {key: value for key, value in params.items() if key not in CACHE_OPTIONS}
+
+
+def _normalise(params):
+    # What the parameters read back as from JSON (tuples become lists), for comparison
+    return json.loads(json.dumps(params, sort_keys=True))
+
+
+def run_incremental(func, tasks, files, output_folder, params, jobs=None, message="Processing", watching=False):
+    """
+    run_batch over the tasks whose inputs or parameters changed since the last
+    run into `output_folder`, as recorded in its Manifest, after pruning the
+    outputs of tasks whose inputs are gone.
+
+    files[name] gives the (inputs, outputs) paths of each task and `params`
+    every setting that changes the outputs. When `watching`, inputs modified
+    in the last WATCH_SETTLE seconds wait for a later poll, failed tasks are
+    only retried once their inputs change, and nothing is printed when there
+    is nothing to do. Returns the failures of run_batch.
+    """
+    manifest = Manifest(output_folder)
+    pruned = manifest.prune(files)
+    for name in pruned:
+        print(f"Removed outputs of {name}: input no longer present")
+
+    now = time.time()
+    pending, waiting = [], 0
+    for name, args in tasks:
+        inputs, outputs = files[name]
+        try:
+            if watching and any(now - os.path.getmtime(path) < WATCH_SETTLE for path in inputs):
+                waiting += 1
+            elif not manifest.is_current(name, inputs, outputs, params, retry_failed=not watching):
+                pending.append((name, args))
+        except FileNotFoundError:
+            # Deleted since the folder was listed: pruned on the next run
+            waiting += 1
+
+    if pending or pruned or not watching:
+        print(f"{len(tasks) - len(pending) - waiting} files up to date, {len(pending)} to process"
+              + (f", {waiting} left for the next poll" if waiting else ""))
+    failures = []
+    if pending:
+        results = []
+        try:
+            failures = run_batch(func, pending, jobs, message, results=results)
+        finally:
+            # Also on Ctrl+C: whatever finished is recorded and skipped next time
+            for name, _ in results:
+                manifest.record(name, *files[name], params)
+            for name, _ in failures:
+                manifest.record(name, *files[name], params, failed=True)
+            manifest.save()
+    elif manifest.changed:
+        manifest.save()
+    return failures
+
+
+def run_folder(func, tasks, files, output_folder, params, jobs=None, message="Processing", incremental=False,
+               watching=False):
+    """
+    run_batch over every task, or with `incremental` (implied by `watching`)
+    run_incremental over those that changed; the arguments are theirs.
+    Returns the failures.
+    """
+    if not (incremental or watching):
+        return run_batch(func, tasks, jobs, message)
+    return run_incremental(func, tasks, files, output_folder, params, jobs, message, watching)
+
+
+def run_or_watch(run, watching=False, interval=2.0):
+    """
+    Return the failures of run(), or with `watching` keep calling
+    run(watching=True) through watch() until Ctrl+C and return none.
+    """
+    if not watching:
+        return run()
+    watch(partial(run, watching=True), interval)
+    return []
+
+
+def watch(update, interval=2.0):
+    """
+    Call update() now and then every `interval` seconds until Ctrl+C: a
+    polling loop that picks up files as they arrive in the input folder.
+    """
+    print(f"Watching for changes every {interval:g}s, Ctrl+C to stop")
+    try:
+        while True:
+            update()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
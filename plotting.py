@@ -0,0 +1,73 @@
+from profiling import stage
+
+IMAGE_FORMATS = ['png', 'svg', 'pdf']
+
+
+class SpectrumFigure:
+    """
+    A styled spectrum figure that is built once and reused for every file:
+    only the line data (and legend labels) change between saves.
+
+    `build(fig)` receives a fresh Figure, applies limits, ticks, spines, grid
+    and so on (including the log frequency scale), and returns the Axes to draw
+    in. `line_style(i)` gives the plot keyword arguments of the i-th curve;
+    lines are created the first time they are needed and hidden when a file has
+    fewer curves.
+
+    The layout is fixed, so tight_layout runs once when the figure is built and
+    the tight bounding box is measured on the first save at each dpi only;
+    later saves crop to the same box without measuring again.
+    """
+    def __init__(self, build, line_style, legend=False):
+        # matplotlib is imported only once a figure is needed, so runs that
+        # only export numbers never load it
+        with stage('setup'):
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+
+            self.fig = Figure()
+            FigureCanvasAgg(self.fig)
+            self.ax = build(self.fig)
+            self.fig.tight_layout()
+        self.line_style = line_style
+        self.legend = legend
+        self.lines = []
+        self._bboxes = {}
+
+    def set_curves(self, freq, curves, labels=None):
+        with stage('plot'):
+            self._set_curves(freq, curves, labels)
+
+    def _set_curves(self, freq, curves, labels):
+        for i, dbfs in enumerate(curves):
+            if i == len(self.lines):
+                # Not semilogx: setting the scale again would reset the ticks build() chose
+                line, = self.ax.plot([], [], **self.line_style(i))
+                self.lines.append(line)
+            self.lines[i].set_data(freq, dbfs)
+            self.lines[i].set_visible(True)
+            if labels is not None:
+                self.lines[i].set_label(labels[i])
+        for line in self.lines[len(curves):]:
+            line.set_visible(False)
+            line.set_label('_hidden')
+        if self.legend:
+            self.ax.legend()
+
+    def save(self, output_file, dpi=300):
+        with stage('savefig'):
+            self._save(output_file, dpi)
+
+    def _save(self, output_file, dpi):
+        bbox = self._bboxes.get(dpi)
+        if bbox is None:
+            # Same box savefig(bbox_inches='tight') would compute: text extents
+            # depend on the dpi, so measure with a renderer at the output dpi
+            screen_dpi = self.fig.dpi
+            self.fig.dpi = dpi
+            try:
+                bbox = self.fig.get_tightbbox(self.fig.canvas.get_renderer()).padded(0.1)
+            finally:
+                self.fig.dpi = screen_dpi
+            self._bboxes[dpi] = bbox
+        self.fig.savefig(output_file, dpi=dpi, bbox_inches=bbox)
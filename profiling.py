@@ -0,0 +1,188 @@
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Returned by stage() while profiling is off: entering it costs one method call
+_DISABLED = nullcontext()
+
+_stages = None       # name -> {'wall', 'cpu', 'calls'[, 'peak_mb']} for the current file, None when off
+_memory = False
+_log_path = None
+_files = []          # (name, record) of every file logged in this process
+
+
+class _Stage:
+    __slots__ = ('name', 'wall', 'cpu', 'base')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _memory:
+            tracemalloc.reset_peak()
+            self.base = tracemalloc.get_traced_memory()[0]
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        entry = _stages.get(self.name)
+        if entry is None:
+            entry = _stages[self.name] = {'wall': 0.0, 'cpu': 0.0, 'calls': 0}
+        entry['wall'] += wall
+        entry['cpu'] += cpu
+        entry['calls'] += 1
+        if _memory:
+            peak = (tracemalloc.get_traced_memory()[1] - self.base) / 2 ** 20
+            entry['peak_mb'] = max(entry.get('peak_mb', 0.0), peak)
+        return False
+
+
+def enable(log_path=None, memory=False):
+    """
+    Start recording stages in this process. With `memory`, tracemalloc runs
+    too and every stage gets its peak allocation; it slows down code that
+    allocates many Python objects (CSV export, plotting) several times over,
+    so their timings are only indicative then. Records of finished files are
+    appended as JSON lines to `log_path` if given.
+    """
+    global _stages, _memory, _log_path
+    _stages = {}
+    _memory = memory
+    _log_path = log_path
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if log_path:
+        open(log_path, 'w').close()
+
+
+def disable():
+    """Stop recording, and stop tracemalloc if memory tracing was on."""
+    global _stages, _memory, _log_path
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _stages = None
+    _memory = False
+    _log_path = None
+
+
+# Help of the options added by add_profile_arguments; spectrum.py passes its own in Italian
+PROFILE_HELP = {
+    'profile': 'Record the wall and CPU time of every stage to a JSON-lines log and print the slowest stages '
+               'and files (default log: profile.jsonl)',
+    'profile_memory': 'With --profile, also record the peak allocation of every stage; tracemalloc slows '
+                      'Python-heavy stages such as plotting and CSV export',
+}
+
+
+def add_profile_arguments(parser, help=PROFILE_HELP):
+    """--profile [LOG] and --profile-memory, read back as args.profile and args.profile_memory for enable()."""
+    parser.add_argument('--profile', nargs='?', const='profile.jsonl', metavar='LOG', help=help['profile'])
+    parser.add_argument('--profile-memory', action='store_true', help=help['profile_memory'])
+
+
+def is_enabled():
+    return _stages is not None
+
+
+def memory_enabled():
+    return _memory
+
+
+def stage(name):
+    """
+    Context manager timing one stage of the current file: wall time, CPU time
+    and, with memory tracing, the peak allocated above what was in use when
+    the stage started. Repeated stages add up. Stages must not nest.
+    """
+    if _stages is None:
+        return _DISABLED
+    return _Stage(name)
+
+
+def collect():
+    """Return the stages recorded since the last call and start afresh."""
+    global _stages
+    stages, _stages = _stages, {}
+    return stages
+
+
+def max_rss_mb():
+    """Peak resident memory of this process so far, in MB, or None where it is unavailable (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux and the BSDs
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 1024
+
+
+def log_file(name, stages, wall, cpu, rss_mb=None):
+    """
+    Record one processed file: append it to the JSON-lines log and keep it for
+    summary(). rss_mb is max_rss_mb() of the process that ran it, at the end.
+    """
+    record = {'file': name, 'wall': wall, 'cpu': cpu, 'stages': stages}
+    if rss_mb is not None:
+        record['max_rss_mb'] = rss_mb
+    if any('peak_mb' in entry for entry in stages.values()):
+        record['peak_mb'] = max(entry.get('peak_mb', 0.0) for entry in stages.values())
+    _files.append((name, record))
+    if _log_path:
+        with open(_log_path, 'a') as fid:
+            fid.write(json.dumps(record) + '\n')
+
+
+def profile_file(name):
+    """
+    Context manager recording everything inside it as one file `name`, for
+    tools that process a single file without run_batch.
+    """
+    if _stages is None:
+        return _DISABLED
+    return _profile_file(name)
+
+
+@contextmanager
+def _profile_file(name):
+    collect()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        log_file(name, collect(), time.perf_counter() - wall, time.process_time() - cpu, max_rss_mb())
+
+
+def summary(top=5):
+    """Print the stages with the most total time over all logged files, then the slowest files."""
+    if not _files:
+        return
+    totals = {}
+    for _, record in _files:
+        for name, entry in record['stages'].items():
+            total = totals.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'peak_mb': 0.0})
+            total['wall'] += entry['wall']
+            total['cpu'] += entry['cpu']
+            total['calls'] += entry['calls']
+            total['peak_mb'] = max(total['peak_mb'], entry.get('peak_mb', 0.0))
+    wall = sum(record['wall'] for _, record in _files)
+    # Whatever no stage covers: imports, process start-up, bookkeeping
+    other = wall - sum(total['wall'] for total in totals.values())
+    cpu = sum(record['cpu'] for _, record in _files) - sum(total['cpu'] for total in totals.values())
+    totals['other'] = {'wall': max(other, 0.0), 'cpu': max(cpu, 0.0), 'calls': len(_files), 'peak_mb': 0.0}
+
+    print(f"Profile: {len(_files)} files, {wall:.2f}s" + (f", log in {_log_path}" if _log_path else ""))
+    print("  Slowest stages (total wall / CPU, calls" + (", peak):" if _memory else "):"))
+    for name, total in sorted(totals.items(), key=lambda item: -item[1]['wall'])[:top]:
+        share = total['wall'] / wall * 100 if wall > 0 else 0
+        peak = f", {total['peak_mb']:.1f} MB" if _memory and name != 'other' else ""
+        print(f"    {name:<10} {total['wall']:8.3f}s / {total['cpu']:.3f}s ({share:.0f}%), {total['calls']} calls{peak}")
+    print("  Slowest files:")
+    for name, record in sorted(_files, key=lambda item: -item[1]['wall'])[:top]:
+        slowest = max(record['stages'].items(), key=lambda item: item[1]['wall'], default=('-', {'wall': 0.0}))
+        rss = f", {record['max_rss_mb']:.0f} MB resident" if 'max_rss_mb' in record else ""
+        print(f"    {name}: {record['wall']:.3f}s (most in {slowest[0]}, {slowest[1]['wall']:.3f}s){rss}")
@@ -0,0 +1,161 @@
+import argparse
+import os
+import sys
+from functools import partial
+import numpy as np
+import profiling
+from batch import run_batch, add_batch_arguments
+from plotting import IMAGE_FORMATS
+from profiling import stage
+from spectrumengine import get_analyzer, add_analysis_arguments, analyzer_options, ANALYSIS_HELP
+from spectrumexport import log_grid
+
+# --array choices: float16 dBFS, or 8-bit codes over [--db-min, 0] dBFS
+ARRAY_FORMATS = ['float16', 'uint8']
+
+
+def log_frequency_image(freq, dbfs, rows):
+    """
+    Interpolate each spectrum of dbfs (segments, freq) onto `rows` log-spaced
+    frequencies. The interpolation weights are computed once and applied to
+    all segments together. Returns (grid, image) with image (rows, segments).
+    """
+    grid = log_grid(freq, rows)
+    upper = np.clip(np.searchsorted(freq, grid), 1, len(freq) - 1)
+    lower = upper - 1
+    log_freq = np.log(np.maximum(freq, np.finfo(float).tiny))
+    weight = (np.log(grid) - log_freq[lower]) / (log_freq[upper] - log_freq[lower])
+    weight = np.clip(weight, 0, 1).astype(np.float32)
+    image = dbfs[:, lower] * (1 - weight) + dbfs[:, upper] * weight
+    return grid, image.T
+
+
+def render_spectrogram(times, freq, dbfs, output_file, rows=512, db_min=-120, db_max=-20, dpi=300):
+    hop = times[1] - times[0] if len(times) > 1 else 2 * times[0]
+    # No more columns than the image has pixels: average groups of segments first
+    group = max(1, len(times) // int(12 * dpi))
+    if group > 1:
+        n = len(times) // group
+        dbfs = dbfs[:n * group].reshape(n, group, -1).mean(axis=1, dtype=np.float32)
+        times = times[:n * group].reshape(n, group).mean(axis=1)
+        hop *= group
+    with stage('plot'):
+        fig = _draw_spectrogram(times, freq, dbfs, rows, db_min, db_max, hop)
+    with stage('savefig'):
+        fig.savefig(output_file, dpi=dpi, bbox_inches='tight')
+
+
+def _draw_spectrogram(times, freq, dbfs, rows, db_min, db_max, hop):
+    from matplotlib import colormaps
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.colors import Normalize
+    from matplotlib.figure import Figure
+
+    grid, image = log_frequency_image(freq, dbfs, rows)
+    fig = Figure(figsize=(12, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    # Colour map to 8-bit RGBA here: matplotlib then resamples a small uint8
+    # image instead of a float64 copy of the data at the output resolution
+    colours = ScalarMappable(Normalize(db_min, db_max), colormaps['magma'])
+    # Rows are uniform in log frequency: one image on a log10(Hz) axis, ticks labelled in Hz
+    ax.imshow(colours.to_rgba(image, bytes=True), origin='lower', aspect='auto', interpolation='antialiased',
+              extent=(times[0] - hop / 2, times[-1] + hop / 2, np.log10(grid[0]), np.log10(grid[-1])))
+    # Ticks outside the image (e.g. 20 Hz just below the first band) are not drawn
+    ticks = [20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000]
+    ax.set_yticks(np.log10(ticks), [f"{f // 1000}k" if f >= 1000 else str(f) for f in ticks])
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Frequency (Hz)')
+    fig.colorbar(colours, ax=ax, label='Amplitude (dBFS)')
+    fig.tight_layout()
+    return fig
+
+
+def save_spectrogram_array(path, times, freq, dbfs, array_format='float16', db_min=-120):
+    """
+    Write the spectrogram to a compressed .npz with 'times', 'freq' and
+    'dbfs'. With uint8, 'dbfs' holds codes and the values are
+    dbfs_floor + code * dbfs_step, clipped to [db_min, 0] dBFS.
+    """
+    arrays = {'times': times.astype(np.float32), 'freq': freq.astype(np.float32)}
+    if array_format == 'float16':
+        arrays['dbfs'] = dbfs.astype(np.float16)
+    elif array_format == 'uint8':
+        step = -db_min / 255
+        arrays['dbfs'] = np.clip(np.rint((dbfs - db_min) / step), 0, 255).astype(np.uint8)
+        arrays['dbfs_floor'] = np.float32(db_min)
+        arrays['dbfs_step'] = np.float32(step)
+    else:
+        raise ValueError(f"Unknown array format '{array_format}', expected one of {ARRAY_FORMATS}")
+    with stage('export'):
+        np.savez_compressed(path, **arrays)
+
+
+def spectrogram_file(input_file, output_file, array_file=None, hop_size=0.05, rows=512, db_min=-120, db_max=-20,
+                     dpi=300, array_format='float16', **analyzer_options):
+    analyzer = get_analyzer(**analyzer_options)
+    times, freq, dbfs = analyzer.spectrogram(input_file, hop_size)
+
+    if output_file is not None:
+        render_spectrogram(times, freq, dbfs, output_file, rows, db_min, db_max, dpi)
+        print(f"Spectrogram saved to {output_file}")
+    if array_file is not None:
+        save_spectrogram_array(array_file, times, freq, dbfs, array_format, db_min)
+        print(f"Spectrogram array saved to {array_file}")
+
+
+def process_directory(input_folder, output_folder, jobs=None, image_format='png', plot=True, array_format=None,
+                      **options):
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    tasks = []
+    for file_name in sorted(os.listdir(input_folder)):
+        if file_name.lower().endswith('.wav'):
+            stem = os.path.join(output_folder, os.path.splitext(file_name)[0])
+            tasks.append((file_name, (os.path.join(input_folder, file_name),
+                                      f"{stem}.{image_format}" if plot else None,
+                                      f"{stem}.npz" if array_format else None)))
+    return run_batch(partial(spectrogram_file, array_format=array_format, **options), tasks, jobs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate time-resolved spectrograms of a WAV file or of all WAV files in a folder')
+    parser.add_argument('input', type=str, help='WAV file, or folder containing WAV files')
+    parser.add_argument('output', type=str,
+                        help='Output image (its extension sets the format), or output folder when the input is a folder')
+    parser.add_argument('--window', type=float, default=0.1, help='Length of each analysis segment in seconds (default: 0.1)')
+    parser.add_argument('--hop', type=float, default=0.05, help='Time between segments in seconds (default: 0.05)')
+    add_analysis_arguments(parser, dict(ANALYSIS_HELP, block='Seconds of audio read per block (default: 30)'),
+                           smoothing='1/24', modes=False, cache=False)
+    parser.add_argument('--rows', type=int, default=512, help='Log-spaced frequency rows of the image (default: 512)')
+    parser.add_argument('--db-min', type=float, default=-120, help='dBFS at the bottom of the colour scale (default: -120)')
+    parser.add_argument('--db-max', type=float, default=-20, help='dBFS at the top of the colour scale (default: -20)')
+    parser.add_argument('--dpi', type=int, default=300, help='DPI of the saved images (default: 300)')
+    parser.add_argument('--format', choices=IMAGE_FORMATS, default='png', help='Image format for a folder input (default: png)')
+    parser.add_argument('--array', choices=ARRAY_FORMATS,
+                        help='Also save the spectrogram as a compressed .npz next to the image: float16 dBFS, '
+                             'or uint8 codes over --db-min to 0 dBFS')
+    parser.add_argument('--no-plot', action='store_true', help='Only save the --array files, without rendering images')
+    add_batch_arguments(parser, incremental=False)
+    profiling.add_profile_arguments(parser)
+
+    args = parser.parse_args()
+    if args.no_plot and not args.array:
+        parser.error('--no-plot requires --array')
+    if args.profile:
+        profiling.enable(args.profile, args.profile_memory)
+    options = dict(hop_size=args.hop, rows=args.rows, db_min=args.db_min, db_max=args.db_max, dpi=args.dpi,
+                   window_size=args.window, **analyzer_options(args))
+
+    if os.path.isdir(args.input):
+        failures = process_directory(args.input, args.output, args.jobs, args.format, not args.no_plot, args.array,
+                                     **options)
+        profiling.summary()
+        sys.exit(1 if failures else 0)
+    array_file = f"{os.path.splitext(args.output)[0]}.npz" if args.array else None
+    with profiling.profile_file(os.path.basename(args.input)):
+        spectrogram_file(args.input, None if args.no_plot else args.output, array_file,
+                         array_format=args.array, **options)
+    profiling.summary()
@@ -1,114 +1,100 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.io import wavfile
 import argparse
-from scipy import signal as sg
-from scipy.ndimage import gaussian_filter1d
 import os
-import warnings
+import sys
+from functools import lru_cache, partial
+import profiling
+from batch import run_batch, add_batch_arguments
+from manifest import run_folder, run_or_watch, output_params
+from plotting import SpectrumFigure
+from spectrumexport import export_spectrum, add_output_arguments, output_options
+from spectrumengine import get_analyzer, add_analysis_arguments, analyzer_options
 
-def analyze_audio_file(input_file, fs_out=None, signal_out=None, analysis_second=7, window_size=10):
+def analyze_audio_file(input_file, fs_out=None, signal_out=None, analysis_second=7, window_size=10, **analyzer_options):
     """
     Analizza un file audio e restituisce la frequenza di campionamento e il segnale elaborato.
     Se fs_out e signal_out sono forniti, li restituisce insieme ai nuovi valori.
     """
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", category=wavfile.WavFileWarning)
-        fs, original_signal = wavfile.read(input_file)
-
-    if len(original_signal.shape) > 1:
-        original_signal = np.mean(original_signal, axis=1)
-
-    # Normalizzazione del segnale
-    if original_signal.dtype == np.int16:
-        signal = original_signal / 32768.0
-    elif original_signal.dtype == np.int32:
-        signal = original_signal / 2147483648.0
-    elif original_signal.dtype == np.float32 or original_signal.dtype == np.float64:
-        signal = original_signal
-    else:
-        signal = original_signal / np.iinfo(original_signal.dtype).max
-
-    # Ricampionamento a 48kHz se necessario
-    target_fs = 48000
-    if fs != target_fs:
-        num_samples = int(len(signal) * target_fs / fs)
-        signal = sg.resample(signal, num_samples)
-        fs = target_fs
-
-    # Seleziona il segmento da analizzare
-    duration = len(signal) / fs
-    if analysis_second >= duration:
-        analysis_second = duration - window_size
-
-    start_sample = int(analysis_second * fs)
-    window_samples = int(window_size * fs)
-    segment = signal[start_sample:start_sample + window_samples]
-
-    # Applica finestra di Hann
-    window = sg.windows.hann(len(segment))
-    segment_windowed = segment * window
-
-    # Calcola la FFT
-    n_fft = max(16384, window_samples)
-    fft_result = np.fft.rfft(segment_windowed, n=n_fft)
-    freq = np.fft.rfftfreq(n_fft, d=1/fs)
-    magnitude = np.abs(fft_result) / (n_fft/2)
-    magnitude[1:-1] = magnitude[1:-1] * 2
-    dbfs = 20 * np.log10(np.clip(magnitude, 1e-10, None))
-    dbfs = gaussian_filter1d(dbfs, sigma=100)
+    # Analizzatore condiviso: finestra di Hann, asse delle frequenze e kernel di smoothing vengono riusati
+    analyzer = get_analyzer(analysis_second=analysis_second, window_size=window_size, **analyzer_options)
+    freq, dbfs = analyzer.analyze(input_file)
+    fs = analyzer.fs
 
     if fs_out is not None and signal_out is not None:
         return fs, freq, dbfs, fs_out, signal_out
     else:
         return fs, freq, dbfs
 
-def compare_audio_files(input_file1, input_file2, output_file, analysis_second=7, window_size=10, label1=None, label2=None):
+def build_compare_figure(fig):
     """
-    Confronta due file audio generando un grafico che sovrappone i loro spettri.
+    Assi del grafico di confronto: limiti, griglia, tacche ed etichette.
     """
-    # Analizza i due file audio
-    fs1, freq1, dbfs1 = analyze_audio_file(input_file1, analysis_second=analysis_second, window_size=window_size)
-    fs2, freq2, dbfs2 = analyze_audio_file(input_file2, analysis_second=analysis_second, window_size=window_size)
+    fig.set_size_inches(12, 4)
+    ax = fig.add_subplot()
+    ax.set_xscale('log')
 
-    # Se non sono fornite etichette, usa i nomi dei file
-    if label1 is None:
-        label1 = os.path.basename(input_file1)
-    if label2 is None:
-        label2 = os.path.basename(input_file2)
+    ax.set_xlim(20, 24000)
+    ax.set_ylim(-120, -40)
 
-    # Crea il grafico
-    plt.figure(figsize=(12, 4))
-    plt.semilogx(freq1, dbfs1, linewidth=3.0, alpha=0.8, label=label1, color="red")
-    plt.semilogx(freq2, dbfs2, linewidth=3.0, alpha=0.8, label=label2)
+    # Aggiungi griglia e etichette
+    ax.grid(True, alpha=0.3, which='both')
+    ax.grid(True, alpha=0.15, which='minor')
 
-    plt.xlim(20, 24000)
-    plt.ylim(-120, -40)
+    ax.set_xticks([20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000],
+                  ['20', '50', '100', '200', '500', '1k', '2k', '5k', '10k', '20k'])
 
-    # Mostra la legenda
-    plt.legend()
+    ax.set_yticks([-120, -110, -100, -90, -80, -70, -60, -50, -40],
+                  ['-120', '-110', '-100', '-90', '-80', '-70', '-60', '-50', '-40'])
 
-    # Aggiungi griglia e etichette
-    plt.grid(True, alpha=0.3, which='both')
-    plt.grid(True, alpha=0.15, which='minor')
+    ax.set_xlabel('Frequenza (Hz)')
+    ax.set_ylabel('Ampiezza (dBFS)')
+    return ax
 
-    plt.xticks([20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000],
-               ['20', '50', '100', '200', '500', '1k', '2k', '5k', '10k', '20k'])
+def compare_line_style(index):
+    # Il primo file in rosso, il secondo con il primo colore del ciclo
+    return {'linewidth': 3.0, 'alpha': 0.8, 'color': 'red'} if index == 0 else {'linewidth': 3.0, 'alpha': 0.8}
 
-    plt.yticks([-120, -110, -100, -90, -80, -70, -60, -50, -40],
-               ['-120', '-110', '-100', '-90', '-80', '-70', '-60', '-50', '-40'])
+@lru_cache(maxsize=None)
+def compare_figure():
+    """
+    Figura di confronto costruita una volta per processo e riusata per ogni
+    coppia: tra un salvataggio e l'altro cambiano solo le curve e la legenda.
+    """
+    return SpectrumFigure(build_compare_figure, compare_line_style, legend=True)
+
+def compare_audio_files(input_file1, input_file2, output_file, analysis_second=7, window_size=10, label1=None, label2=None,
+                        dpi=300, export_file=None, export_format='npz', export_points=None, **analyzer_options):
+    """
+    Confronta due file audio generando un grafico che sovrappone i loro spettri.
+    Con `export_file` scrive anche i due spettri in formato numerico (npz, csv o
+    json); con output_file=None il grafico non viene generato.
+    """
+    # Analizza i due file audio
+    fs1, freq1, dbfs1 = analyze_audio_file(input_file1, analysis_second=analysis_second, window_size=window_size,
+                                           **analyzer_options)
+    fs2, freq2, dbfs2 = analyze_audio_file(input_file2, analysis_second=analysis_second, window_size=window_size,
+                                           **analyzer_options)
 
-    plt.xlabel('Frequenza (Hz)')
-    plt.ylabel('Ampiezza (dBFS)')
+    # Se non sono fornite etichette, usa i nomi dei file
+    if label1 is None:
+        label1 = os.path.basename(input_file1)
+    if label2 is None:
+        label2 = os.path.basename(input_file2)
 
-    plt.tight_layout()
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
-    print(f"Analisi completa. Grafico salvato in {output_file}")
-    plt.close()
+    render_comparison(freq1, np.array([dbfs1, dbfs2]), [label1, label2], output_file, dpi=dpi,
+                      export_file=export_file, export_format=export_format, export_points=export_points)
 
-def process_directory_pairs(input_folder1, input_folder2, output_folder, analysis_second=7, window_size=5):
+def process_directory_pairs(input_folder1, input_folder2, output_folder, analysis_second=7, window_size=5, jobs=None,
+                            dpi=300, image_format='png', plot=True, export_format=None, export_points=None,
+                            incremental=False, watching=False, **analyzer_options):
     """
     Processa coppie di file audio con lo stesso nome da due cartelle diverse.
+    Le coppie vengono distribuite su `jobs` processi (default: numero di CPU);
+    i grafici sono salvati in `image_format` (png, svg o pdf) a `dpi`, gli
+    spettri in `export_format` (npz, csv o json) se richiesto.
+    Con `incremental` (o `watching`) vengono elaborate solo le coppie nuove o
+    modificate dall'ultima esecuzione e si eliminano gli output delle coppie
+    non più presenti; vedi manifest.run_incremental.
     """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
@@ -116,28 +102,202 @@ def process_directory_pairs(input_folder1, input_folder2, output_folder, analysi
     # Trova i file .wav comuni a entrambe le cartelle
     files1 = {f for f in os.listdir(input_folder1) if f.lower().endswith('.wav')}
     files2 = {f for f in os.listdir(input_folder2) if f.lower().endswith('.wav')}
-    common_files = files1.intersection(files2)
+    common_files = sorted(files1.intersection(files2))
 
+    tasks = []
+    files = {}
     for file_name in common_files:
         input_file1 = os.path.join(input_folder1, file_name)
         input_file2 = os.path.join(input_folder2, file_name)
-        output_file = os.path.join(output_folder, f"compare_{file_name.replace('.wav', '.png')}")
+        stem = os.path.join(output_folder, f"compare_{os.path.splitext(file_name)[0]}")
+        output_file = export_file = None
+        if plot:
+            output_file = f"{stem}.{image_format}"
+        if export_format:
+            export_file = f"{stem}.{export_format}"
 
-        print(f"Confronto: {file_name}")
-        compare_audio_files(input_file1, input_file2, output_file,
-                            analysis_second, window_size,
-                            label1=f"Cartella 1: {file_name}",
-                            label2=f"Cartella 2: {file_name}")
+        tasks.append((file_name, (input_file1, input_file2, output_file,
+                                  analysis_second, window_size,
+                                  f"Cartella 1: {file_name}",
+                                  f"Cartella 2: {file_name}",
+                                  dpi, export_file, export_format, export_points)))
+        files[file_name] = [input_file1, input_file2], [path for path in (output_file, export_file) if path]
 
-def compare_two_files(input_file1, input_file2, output_file, analysis_second=7, window_size=5, label1=None, label2=None):
+    params = output_params(tool='spectrum folders', analysis_second=analysis_second, window_size=window_size,
+                           dpi=dpi, image_format=image_format, plot=plot, export_format=export_format,
+                           export_points=export_points, **analyzer_options)
+    return run_folder(partial(compare_audio_files, **analyzer_options), tasks, files, output_folder, params, jobs,
+                      message="Confronto", incremental=incremental, watching=watching)
+
+def compare_two_files(input_file1, input_file2, output_file, analysis_second=7, window_size=5, label1=None, label2=None,
+                      dpi=300, plot=True, export_format=None, export_points=None, **analyzer_options):
     """
-    Confronta due file audio specifici.
+    Confronta due file audio specifici. Gli spettri esportati vanno accanto a
+    `output_file`, con l'estensione di `export_format`.
     """
+    export_file = f"{os.path.splitext(output_file)[0]}.{export_format}" if export_format else None
     print(f"Confronto: {os.path.basename(input_file1)} vs {os.path.basename(input_file2)}")
-    compare_audio_files(input_file1, input_file2, output_file,
+    compare_audio_files(input_file1, input_file2, output_file if plot else None,
                         analysis_second, window_size,
                         label1=label1 if label1 else os.path.basename(input_file1),
-                        label2=label2 if label2 else os.path.basename(input_file2))
+                        label2=label2 if label2 else os.path.basename(input_file2),
+                        dpi=dpi, export_file=export_file, export_format=export_format,
+                        export_points=export_points, **analyzer_options)
+
+def build_delta_figure(fig, delta_range):
+    """
+    Assi del grafico delle differenze rispetto al riferimento, in dB, con
+    limiti +-`delta_range`.
+    """
+    ax = build_compare_figure(fig)
+    ax.set_ylim(-delta_range, delta_range)
+    # Etichette esplicite: quelle fisse del grafico degli spettri non valgono qui
+    ticks = np.linspace(-delta_range, delta_range, 9)
+    ax.set_yticks(ticks, [f"{tick:g}" for tick in ticks])
+    ax.set_ylabel('Differenza (dB)')
+    return ax
+
+@lru_cache(maxsize=None)
+def delta_figure(delta_range):
+    return SpectrumFigure(partial(build_delta_figure, delta_range=delta_range), compare_line_style, legend=True)
+
+def render_comparison(freq, curves, labels, output_file, reference=None, delta_file=None, delta_range=12, dpi=300,
+                      export_file=None, export_format='npz', export_points=None):
+    """
+    Disegna gli spettri già calcolati `curves` (uno per riga) sovrapposti e,
+    se `reference` è l'indice di una riga, la differenza in dB di ogni curva
+    rispetto a quella in `delta_file`. Nell'esportazione le differenze
+    seguono gli spettri, come righe "etichetta - riferimento".
+    """
+    if output_file is not None:
+        figure = compare_figure()
+        figure.set_curves(freq, curves, labels)
+        figure.save(output_file, dpi=dpi)
+        print(f"Analisi completa. Grafico salvato in {output_file}")
+
+    names = list(labels)
+    if reference is not None:
+        # Il riferimento resta nel grafico come linea a 0 dB, con lo stesso colore
+        delta = curves - curves[reference]
+        delta_labels = [f"{label} - {labels[reference]}" for label in labels]
+        if delta_file is not None:
+            figure = delta_figure(delta_range)
+            figure.set_curves(freq, delta, delta_labels)
+            figure.save(delta_file, dpi=dpi)
+            print(f"Differenze salvate in {delta_file}")
+        others = [i for i in range(len(curves)) if i != reference]
+        curves = np.concatenate([curves, delta[others]])
+        names += [delta_labels[i] for i in others]
+
+    if export_file is not None:
+        export_spectrum(export_file, freq, curves, names, export_format, export_points)
+        print(f"Spettri esportati in {export_file}")
+
+def compare_many(inputs, output, labels=None, reference=None, analysis_second=7, window_size=5, jobs=None, dpi=300,
+                 image_format='png', plot=True, export_format=None, export_points=None, delta_range=12,
+                 **analyzer_options):
+    """
+    Confronta un numero qualsiasi di file, oppure di cartelle (un grafico per
+    ogni file .wav presente in tutte). Ogni file viene analizzato una sola
+    volta, anche se compare in più confronti, e le analisi e poi i grafici
+    vengono distribuiti su `jobs` processi. `reference` è l'indice
+    dell'ingresso rispetto a cui disegnare le differenze in dB.
+
+    Con dei file `output` è il grafico (il formato segue l'estensione), con
+    delle cartelle è la cartella di output. Restituisce l'elenco dei fallimenti.
+    """
+    if labels is None:
+        labels = [os.path.basename(os.path.normpath(path)) for path in inputs]
+    if len(labels) != len(inputs):
+        raise ValueError(f"{len(labels)} etichette per {len(inputs)} ingressi")
+    if reference is not None and not 0 <= reference < len(inputs):
+        raise ValueError(f"Riferimento {reference + 1} fuori dagli ingressi (1-{len(inputs)})")
+
+    # Un confronto per file (o per nome comune alle cartelle): (nome, file, grafico, differenze, esportazione)
+    groups = []
+    if all(os.path.isdir(path) for path in inputs):
+        if not os.path.exists(output):
+            os.makedirs(output)
+        names = [{f for f in os.listdir(folder) if f.lower().endswith('.wav')} for folder in inputs]
+        for file_name in sorted(set.intersection(*names)):
+            stem = f"compare_{os.path.splitext(file_name)[0]}"
+            groups.append((file_name, [os.path.join(folder, file_name) for folder in inputs],
+                           os.path.join(output, f"{stem}.{image_format}") if plot else None,
+                           os.path.join(output, f"{stem}_delta.{image_format}") if plot else None,
+                           os.path.join(output, f"{stem}.{export_format}") if export_format else None))
+    elif not any(os.path.isdir(path) for path in inputs):
+        stem, extension = os.path.splitext(output)
+        groups.append((os.path.basename(output), list(inputs),
+                       output if plot else None,
+                       f"{stem}_delta{extension}" if plot else None,
+                       f"{stem}.{export_format}" if export_format else None))
+    else:
+        raise ValueError("Indicare solo file oppure solo cartelle")
+
+    # Ogni file distinto una volta sola, qualunque sia il numero di confronti in cui compare
+    unique_files = list(dict.fromkeys(path for group in groups for path in group[1]))
+    tasks = [(path, (path, None, None, analysis_second, window_size)) for path in unique_files]
+    results = []
+    failures = run_batch(partial(analyze_audio_file, **analyzer_options), tasks, jobs, message="Analisi",
+                         results=results)
+    spectra = {path: (freq, dbfs) for path, (_, freq, dbfs) in results}
+
+    tasks = []
+    for name, files, output_file, delta_file, export_file in groups:
+        missing = [path for path in files if path not in spectra]
+        if missing:
+            print(f"Confronto {name} saltato: analisi non riuscita per {', '.join(missing)}")
+            continue
+        freq = spectra[files[0]][0]
+        curves = np.array([spectra[path][1] for path in files])
+        tasks.append((name, (freq, curves, labels, output_file, reference,
+                             delta_file if reference is not None else None,
+                             delta_range, dpi, export_file, export_format, export_points)))
+    return failures + run_batch(render_comparison, tasks, jobs, message="Confronto")
+
+# Testi di aiuto delle opzioni di analisi comuni ai tre comandi
+AIUTO_ANALISI = {
+    'second': 'Secondo in cui eseguire l\'analisi (default: 7)',
+    'window': 'Dimensione della finestra di analisi in secondi (default: 5)',
+    'resample_quality': 'Ricampionamento dei file non a 48kHz: polifase fast/default/best, o fft, il ricampionamento '
+                        'FFT originale su tutto il file, che lo legge per intero (default: default)',
+    'smoothing': 'Smoothing dello spettro: gaussiana su 100 bin o media su bande di 1/N di ottava (default: gaussian)',
+    'mode': 'single: una FFT della finestra a --second; welch: media di segmenti di --window su tutto il file '
+            '(default: single)',
+    'overlap': 'Sovrapposizione tra i segmenti Welch, da 0 a <1 (default: 0.5)',
+    'block': 'Secondi di audio letti e trasformati per blocco in modalità Welch; la memoria è limitata da questo valore (default: 30)',
+    'precision': 'Precisione numerica dell\'analisi: float32 dimezza la memoria ed è più veloce, entro 0.01 dB da '
+                 'float64 sopra -120 dBFS (default: float64)',
+    'cache_dir': 'Cartella in cui gli spettri calcolati restano in cache tra un\'esecuzione e l\'altra (default: %(default)s)',
+    'no_cache': 'Ricalcola sempre, senza leggere né scrivere la cache',
+    'cache_hash': 'Identifica i file in cache con lo SHA-256 del contenuto invece di percorso, dimensione e mtime',
+}
+
+# Testi di aiuto delle opzioni di output, adattati da ogni comando
+AIUTO_USCITA = {
+    'dpi': 'DPI dei grafici; valori bassi per un\'anteprima veloce (default: 300)',
+    'format': 'Formato dei grafici; svg e pdf sono vettoriali (default: png)',
+    'export': 'Scrive anche frequenze e dBFS di ogni coppia nella cartella di output, in questo formato',
+    'export_points': 'Riduce gli spettri esportati a questo numero di frequenze in scala logaritmica (default: tutti i bin)',
+    'no_plot': 'Scrive solo i file di --export, senza generare grafici',
+}
+
+# Testi di aiuto delle opzioni di elaborazione delle cartelle
+AIUTO_BATCH = {
+    'jobs': 'Numero di coppie elaborate in parallelo (default: numero di CPU)',
+    'incremental': 'Elabora solo le coppie nuove o modificate dall\'ultima esecuzione nella cartella di output, o tutte '
+                   'se le impostazioni sono cambiate, ed elimina gli output delle coppie non più presenti',
+    'watch': 'Resta in esecuzione ed elabora le coppie man mano che i file arrivano o cambiano (implica --incremental)',
+    'interval': 'Secondi tra un controllo delle cartelle e il successivo con --watch (default: 2)',
+}
+
+# Testi di aiuto di --profile e --profile-memory
+AIUTO_PROFILO = {
+    'profile': 'Registra tempo reale e tempo CPU di ogni fase in un log JSON lines e riassume le fasi e i file più lenti '
+               '(log predefinito: profile.jsonl)',
+    'profile_memory': 'Con --profile registra anche il picco di memoria allocata da ogni fase; tracemalloc rallenta '
+                      'le fasi in Python come grafici ed esportazione CSV',
+}
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Confronta file audio e genera grafici di spettro FFT sovrapposti')
@@ -147,24 +307,74 @@ if __name__ == "__main__":
     parser_files = subparsers.add_parser('files', help='Confronta due file specifici')
     parser_files.add_argument('input_file1', type=str, help='Percorso del primo file WAV')
     parser_files.add_argument('input_file2', type=str, help='Percorso del secondo file WAV')
-    parser_files.add_argument('output_file', type=str, help='Percorso del file di output PNG')
-    parser_files.add_argument('--second', type=float, default=7, help='Secondo in cui eseguire l\'analisi (default: 7)')
-    parser_files.add_argument('--window', type=float, default=5, help='Dimensione della finestra di analisi in secondi (default: 5)')
+    parser_files.add_argument('output_file', type=str,
+                              help='Percorso del file di output; il formato (png, svg, pdf) segue l\'estensione')
     parser_files.add_argument('--label1', type=str, help='Etichetta personalizzata per il primo file audio')
     parser_files.add_argument('--label2', type=str, help='Etichetta personalizzata per il secondo file audio')
+    add_analysis_arguments(parser_files, AIUTO_ANALISI)
+    add_output_arguments(parser_files, dict(AIUTO_USCITA,
+                                            dpi='DPI del grafico; valori bassi per un\'anteprima veloce (default: 300)',
+                                            export='Scrive anche frequenze e dBFS dei due spettri accanto al file di '
+                                                   'output, in questo formato',
+                                            no_plot='Scrive solo il file di --export, senza generare il grafico'),
+                         image_format=False)
+    profiling.add_profile_arguments(parser_files, AIUTO_PROFILO)
     # Parser per confrontare file corrispondenti in due cartelle
     parser_dirs = subparsers.add_parser('folders', help='Confronta file corrispondenti in due cartelle')
     parser_dirs.add_argument('input_folder1', type=str, help='Percorso della prima cartella di input')
     parser_dirs.add_argument('input_folder2', type=str, help='Percorso della seconda cartella di input')
     parser_dirs.add_argument('output_folder', type=str, help='Percorso della cartella di output per i file PNG')
-    parser_dirs.add_argument('--second', type=float, default=7, help='Secondo in cui eseguire l\'analisi (default: 7)')
-    parser_dirs.add_argument('--window', type=float, default=5, help='Dimensione della finestra di analisi in secondi (default: 5)')
+    add_analysis_arguments(parser_dirs, AIUTO_ANALISI)
+    add_output_arguments(parser_dirs, AIUTO_USCITA)
+    add_batch_arguments(parser_dirs, AIUTO_BATCH)
+    profiling.add_profile_arguments(parser_dirs, AIUTO_PROFILO)
+
+    # Parser per confrontare un numero qualsiasi di file o cartelle
+    parser_multi = subparsers.add_parser('multi', help='Confronta più file o cartelle, analizzando ogni file una sola volta')
+    parser_multi.add_argument('inputs', type=str, nargs='+', help='File WAV, oppure cartelle di cui confrontare i file con lo stesso nome')
+    parser_multi.add_argument('output', type=str,
+                              help='File di output (il formato segue l\'estensione) o, con delle cartelle, cartella di output')
+    parser_multi.add_argument('--labels', type=str, nargs='+', help='Etichette degli ingressi, nello stesso ordine (default: nomi di file o cartelle)')
+    parser_multi.add_argument('--reference', type=int,
+                              help='Numero (da 1) dell\'ingresso di riferimento: aggiunge il grafico delle differenze in dB')
+    parser_multi.add_argument('--delta-range', type=float, default=12,
+                              help='Limiti in dB, +/-, del grafico delle differenze (default: 12)')
+    add_analysis_arguments(parser_multi, AIUTO_ANALISI)
+    add_output_arguments(parser_multi, dict(AIUTO_USCITA,
+                                            format='Formato dei grafici con delle cartelle; svg e pdf sono vettoriali '
+                                                   '(default: png)',
+                                            export='Scrive anche frequenze e dBFS (e le differenze) di ogni confronto, '
+                                                   'in questo formato'))
+    add_batch_arguments(parser_multi, dict(AIUTO_BATCH, jobs='Numero di file elaborati in parallelo (default: numero di CPU)'),
+                        incremental=False)
+    profiling.add_profile_arguments(parser_multi, AIUTO_PROFILO)
 
     args = parser.parse_args()
+    if getattr(args, 'no_plot', False) and not args.export:
+        parser.error('--no-plot richiede --export')
+    if getattr(args, 'profile', None):
+        profiling.enable(args.profile, args.profile_memory)
 
     if args.command == 'files':
-        compare_two_files(args.input_file1, args.input_file2, args.output_file, args.second, args.window, args.label1, args.label2)
+        with profiling.profile_file(os.path.basename(args.output_file)):
+            compare_two_files(args.input_file1, args.input_file2, args.output_file, args.second, args.window, args.label1, args.label2,
+                              **output_options(args), **analyzer_options(args))
+        profiling.summary()
     elif args.command == 'folders':
-        process_directory_pairs(args.input_folder1, args.input_folder2, args.output_folder, args.second, args.window)
+        run = partial(process_directory_pairs, args.input_folder1, args.input_folder2, args.output_folder, args.second,
+                      args.window, args.jobs, incremental=args.incremental, **output_options(args), **analyzer_options(args))
+        failures = run_or_watch(run, args.watch, args.interval)
+        profiling.summary()
+        sys.exit(1 if failures else 0)
+    elif args.command == 'multi':
+        try:
+            failures = compare_many(args.inputs, args.output, args.labels,
+                                    args.reference - 1 if args.reference is not None else None,
+                                    args.second, args.window, args.jobs, delta_range=args.delta_range,
+                                    **output_options(args), **analyzer_options(args))
+        except ValueError as e:
+            parser_multi.error(str(e))
+        profiling.summary()
+        sys.exit(1 if failures else 0)
     else:
         parser.print_help()
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# Part of every key: bump it when what an entry holds changes, so old entries are never read back
+CACHE_VERSION = 4
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pynalizers')
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fid:
+        for chunk in iter(lambda: fid.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SpectrumCache:
+    """
+    On-disk cache of computed dBFS arrays, one .npy file per entry, shared by
+    all the spectrum tools and safe to use from several worker processes.
+
+    An entry is keyed by the analysis parameters plus the file's identity:
+    path, size and mtime, or with content_hash its SHA-256 instead of the path
+    and mtime (a full read of the file, but robust to copies and touch). Entries
+    keep the dtype of the result, so a hit returns exactly what the analysis
+    did. The directory is kept under max_bytes by evicting the
+    least recently used entries.
+    """
+    def __init__(self, cache_dir=None, max_bytes=1 << 30, content_hash=False):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, path, params):
+        stat = os.stat(path)
+        if self.content_hash:
+            identity = {'sha256': file_digest(path), 'size': stat.st_size}
+        else:
+            identity = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        blob = json.dumps({'file': identity, 'params': params}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key + '.npy')
+
+    def get(self, key):
+        entry = self._entry(key)
+        try:
+            dbfs = np.load(entry)
+        except (OSError, ValueError):
+            return None
+        # Touch the entry: its mtime is the LRU clock
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return dbfs
+
+    def put(self, key, dbfs):
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as fid:
+                np.save(fid, np.asarray(dbfs))
+            os.replace(tmp, self._entry(key))
+        except OSError:
+            # A full disk or a read-only cache folder only costs the cache
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.npy'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
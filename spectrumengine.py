@@ -0,0 +1,408 @@
+from functools import lru_cache
+import numpy as np
+from scipy import fft as sp_fft
+from scipy import signal as sg
+from scipy.ndimage import correlate1d
+from scipy.sparse import csr_matrix
+from numpy.lib.stride_tricks import sliding_window_view
+from profiling import stage
+from spectrumcache import SpectrumCache, CACHE_VERSION, default_cache_dir
+from wavsegment import load_analysis_segment, iter_wav_blocks, read_wav_info, check_quality, RESAMPLE_QUALITY
+
+
+def gaussian_kernel(sigma, truncate=4.0):
+    """The kernel gaussian_filter1d(x, sigma) would build on every call."""
+    radius = int(truncate * float(sigma) + 0.5)
+    x = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 / (sigma * sigma) * x ** 2)
+    return kernel / kernel.sum()
+
+
+# --smoothing choices: the Gaussian over linear bins, or fractional-octave bands
+SMOOTHING_CHOICES = ['gaussian', '1/3', '1/6', '1/12', '1/24']
+
+# --mode choices: one FFT of the window at --second, or the Welch average of the whole file
+MODES = ['single', 'welch']
+
+# --precision choices: the original double-precision path, or single precision end to end
+PRECISIONS = ['float64', 'float32']
+
+
+def parse_smoothing(value):
+    """'gaussian' -> None, '1/6' -> 6: the octave_fraction SpectrumAnalyzer expects."""
+    return None if value == 'gaussian' else int(value.split('/')[1])
+
+
+def mix_down(channels):
+    """
+    Average of the rows of `channels` (channels, samples), the same as
+    np.mean(channels, axis=0). Adding whole rows is many times faster than
+    np.mean over the short, strided channel axis of a transposed block.
+    """
+    mixed = channels[0].copy()
+    for channel in channels[1:]:
+        mixed += channel
+    mixed /= len(channels)
+    return mixed
+
+
+def octave_bands(freq, fraction, f_min=20.0, f_max=None):
+    """
+    Fractional-octave band centres (base-2, anchored at 1 kHz) between f_min and
+    f_max, and the sparse (bands x bins) matrix that averages the bins falling in
+    each band. A band narrower than the bin spacing takes its nearest bin, so
+    every row is non-empty.
+    """
+    f_max = freq[-1] if f_max is None else f_max
+    k = np.arange(np.ceil(fraction * np.log2(f_min / 1000)), np.floor(fraction * np.log2(f_max / 1000)) + 1)
+    centers = 1000 * 2 ** (k / fraction)
+    edges = np.searchsorted(freq, centers * 2 ** (-0.5 / fraction)), np.searchsorted(freq, centers * 2 ** (0.5 / fraction))
+
+    rows, cols = [], []
+    for band, (lo, hi) in enumerate(zip(*edges)):
+        if hi <= lo:
+            lo = np.argmin(np.abs(freq - centers[band]))
+            hi = lo + 1
+        rows.append(np.full(hi - lo, band))
+        cols.append(np.arange(lo, hi))
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    weights = 1.0 / np.bincount(rows)[rows]
+    return centers, csr_matrix((weights, (rows, cols)), shape=(len(centers), len(freq)))
+
+
+class SpectrumAnalyzer:
+    """
+    Hann-windowed FFT spectrum in dBFS, smoothed, of one analysis window of an
+    audio file. Configure it once and reuse it: the Hann window, the frequency
+    axis and the smoothing kernel are computed on first use and cached, and the
+    FFT goes through scipy.fft, which keeps its plans between calls.
+
+    Smoothing is either a Gaussian of `smoothing_sigma` bins over the linear FFT
+    grid, or, with `octave_fraction` (e.g. 3, 6, 24), the average dBFS of each
+    1/N-octave band: freq is then the few hundred band centres and the whole
+    smoothing is one sparse matrix product, whatever the window length.
+
+    With mode='welch' the whole file is streamed in blocks of `block_size`
+    seconds and the power of Hann-windowed segments of `window_size` seconds,
+    overlapping by `overlap`, is averaged; analysis_second is then unused.
+
+    With precision='float32' samples are normalised straight to float32 and
+    resampled, windowed, transformed and smoothed in single precision, which
+    halves the memory of every intermediate and speeds up the FFT. Between
+    20 Hz and 20 kHz the curves stay within 0.01 dB of the float64 path
+    wherever it is above -120 dBFS; much lower, single-precision rounding
+    noise takes over. `fft_workers` threads are used per FFT; keep 1 when
+    files are already processed in parallel.
+
+    With a `cache_dir`, analyze(path) results are kept in a SpectrumCache there
+    (at most `cache_size` bytes, keyed by content hash if `cache_hash`), so an
+    unchanged file with unchanged settings costs a single small file load.
+
+    spectrogram(path) streams the same segments, `hop_size` seconds apart,
+    and keeps one smoothed dBFS spectrum per segment instead of the average.
+
+    analyze(path) and analyze_array(x) return (freq, dbfs) and never plot.
+    """
+    def __init__(self, fs=48000, analysis_second=7, window_size=5, n_fft=None, smoothing_sigma=100,
+                 octave_fraction=None, resample_quality='default', mode='single', overlap=0.5, block_size=30,
+                 cache_dir=None, cache_size=1 << 30, cache_hash=False, precision='float64', fft_workers=1):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+        check_quality(resample_quality)
+        if not 0 <= overlap < 1:
+            raise ValueError(f"overlap must be in [0, 1), got {overlap}")
+        self.fs = fs
+        self.analysis_second = analysis_second
+        self.window_size = window_size
+        self.window_samples = int(window_size * fs)
+        self.n_fft = n_fft if n_fft is not None else max(16384, self.window_samples)
+        self.smoothing_sigma = smoothing_sigma
+        self.octave_fraction = octave_fraction
+        self.resample_quality = resample_quality
+        self.mode = mode
+        self.overlap = overlap
+        self.block_size = block_size
+        self.cache = None
+        if cache_dir:
+            try:
+                self.cache = SpectrumCache(cache_dir, cache_size, cache_hash)
+            except OSError as error:
+                print(f"Warning: cannot use the spectrum cache in {cache_dir} ({error.strerror}), continuing without it")
+        self.precision = precision
+        self.dtype = np.dtype(precision)
+        # What the readers are asked for: None keeps the float64 path exactly as it always was
+        self.sample_dtype = self.dtype if precision == 'float32' else None
+        self.fft_workers = fft_workers
+
+        self.fft_freq = np.fft.rfftfreq(self.n_fft, d=1/fs)
+        self.kernel = None
+        self.band_matrix = None
+        if octave_fraction:
+            self.freq, self.band_matrix = octave_bands(self.fft_freq, octave_fraction)
+            self.band_matrix = self.band_matrix.astype(self.dtype)
+        else:
+            self.freq = self.fft_freq
+            if smoothing_sigma:
+                self.kernel = gaussian_kernel(smoothing_sigma)
+        self._window = None
+
+    def hann(self, length):
+        # Only the full window_samples window is kept: a clipped segment, from a
+        # file ending before the window does, has a length of its own each time
+        if length != self.window_samples:
+            return sg.windows.hann(length).astype(self.dtype, copy=False)
+        if self._window is None:
+            self._window = sg.windows.hann(length).astype(self.dtype, copy=False)
+        return self._window
+
+    def load(self, path):
+        """Normalised segment at self.fs: 1-D for mono files, (channels, samples) otherwise."""
+        segment, _ = load_analysis_segment(path, self.analysis_second, self.window_size, target_fs=self.fs,
+                                           quality=self.resample_quality, dtype=self.sample_dtype)
+        return segment.T if segment.ndim > 1 else segment
+
+    def cutoff(self, path):
+        """
+        First FFT bin above the Nyquist frequency of `path` when it has to be
+        upsampled to self.fs, else None. The original whole-file FFT resample
+        left those bins empty, so magnitude() zeroes them and they read -200
+        dBFS as they always did, instead of the roll-off of a polyphase filter.
+        """
+        if self.resample_quality == 'fft':
+            # Already the original resample, leakage above the Nyquist frequency included
+            return None
+        source_fs = read_wav_info(path).fs
+        if source_fs >= self.fs:
+            return None
+        return int(np.searchsorted(self.fft_freq, source_fs / 2, side='right'))
+
+    def analyze_array(self, segment):
+        """
+        Spectrum of a segment already at self.fs, either 1-D or (channels, samples).
+        Every channel goes through the same single windowing, rfft, dB and
+        smoothing pass. Returns (freq, dbfs) with dbfs shaped like the input.
+        """
+        return self.freq, self.to_dbfs(self.magnitude(segment))
+
+    def magnitude(self, segment, cutoff=None):
+        """
+        Hann-windowed rfft magnitude along the last axis, scaled so a full-scale
+        sine reads 1, with the bins from `cutoff` on set to zero (see cutoff()).
+        """
+        with stage('fft'):
+            segment_windowed = segment * self.hann(segment.shape[-1])
+
+            fft_result = sp_fft.rfft(segment_windowed, n=self.n_fft, axis=-1, workers=self.fft_workers)
+            magnitude = np.abs(fft_result)
+            magnitude /= self.n_fft/2
+            magnitude[..., 1:-1] *= 2
+            if cutoff is not None:
+                magnitude[..., cutoff:] = 0
+            return magnitude
+
+    def to_dbfs(self, magnitude):
+        """Smoothed dBFS of a magnitude from magnitude(); overwrites its argument."""
+        with stage('dbfs'):
+            dbfs = np.log10(np.clip(magnitude, 1e-10, None, out=magnitude), out=magnitude)
+            dbfs *= 20
+        with stage('smooth'):
+            return self.smooth(dbfs)
+
+    def smooth(self, dbfs):
+        if self.band_matrix is not None:
+            # The sparse product wants 2-D: fold any leading axes (channels, segments)
+            rows = dbfs.reshape(-1, dbfs.shape[-1])
+            return (self.band_matrix @ rows.T).T.reshape(dbfs.shape[:-1] + (-1,))
+        if self.kernel is None:
+            return dbfs
+        # Same result as gaussian_filter1d(dbfs, sigma), without rebuilding the kernel
+        return correlate1d(dbfs, self.kernel, axis=-1, mode='reflect')
+
+    def analyze(self, path, downmix=True):
+        """
+        Spectrum of the analysis window of `path`. With downmix the channels are
+        averaged and dbfs is 1-D; otherwise dbfs has one row per channel. A
+        mono file is analysed once and gives a single row.
+        """
+        if self.cache is None:
+            return self._analyze(path, downmix)
+        with stage('cache'):
+            key = self.cache.key(path, self.cache_params(downmix))
+            dbfs = self.cache.get(key)
+        if dbfs is None:
+            _, dbfs = self._analyze(path, downmix)
+            with stage('cache'):
+                self.cache.put(key, dbfs)
+        return self.freq, dbfs
+
+    def cache_params(self, downmix):
+        """Every setting that changes the result of analyze(path, downmix)."""
+        params = {
+            'version': CACHE_VERSION, 'fs': self.fs, 'window_size': self.window_size, 'n_fft': self.n_fft,
+            'smoothing_sigma': self.smoothing_sigma, 'octave_fraction': self.octave_fraction,
+            'resample_quality': self.resample_quality, 'mode': self.mode, 'downmix': downmix,
+        }
+        if self.precision != 'float64':
+            params['precision'] = self.precision
+        if self.mode == 'welch':
+            params['overlap'] = self.overlap
+        else:
+            params['analysis_second'] = self.analysis_second
+        return params
+
+    def _analyze(self, path, downmix):
+        if self.mode == 'welch':
+            return self.analyze_welch(path, downmix)
+        segment = self.load(path)
+        cutoff = self.cutoff(path)
+        if segment.ndim == 1:
+            dbfs = self.to_dbfs(self.magnitude(segment, cutoff))
+            return self.freq, dbfs if downmix else dbfs[np.newaxis]
+        if downmix:
+            with stage('downmix'):
+                segment = mix_down(segment)
+        return self.freq, self.to_dbfs(self.magnitude(segment, cutoff))
+
+    def analyze_welch(self, path, downmix=True):
+        """
+        Averaged (Welch) spectrum of the whole file, streamed block by block so
+        memory stays flat whatever its length. The per-segment scaling is the
+        same as analyze_array; averaging power rather than dB removes the
+        downward bias of a single noisy FFT, so noise reads up to 2.5 dB higher.
+        """
+        hop = max(1, int(round(self.window_samples * (1 - self.overlap))))
+        cutoff = self.cutoff(path)
+        power = None
+        count = 0
+        for segments in self.iter_segments(path, hop, downmix):
+            magnitude = self.magnitude(segments, cutoff)
+            with stage('average'):
+                # Square in place; the sum over segments is accumulated in float64 whatever the precision
+                segment_power = np.sum(np.square(magnitude, out=magnitude), axis=1, dtype=np.float64)
+                power = segment_power if power is None else power + segment_power
+            del magnitude
+            count += segments.shape[1]
+
+        dbfs = self.to_dbfs(np.sqrt(power / count))
+        return self.freq, dbfs[0] if downmix else dbfs
+
+    def iter_segments(self, path, hop, downmix=True):
+        """
+        Stream the whole file in blocks of block_size seconds and yield its
+        window_samples-long segments, `hop` samples apart, as (channels,
+        segments, samples) views. The segments come in groups of at most
+        block_size seconds of FFT input, so what magnitude() builds from a
+        group stays bounded by the block size however much they overlap. A
+        file shorter than one segment yields a single segment of whatever
+        there is.
+        """
+        nperseg = self.window_samples
+        group = max(1, int(self.block_size * self.fs) // self.n_fft)
+        buffer = None
+        count = 0
+
+        for block in iter_wav_blocks(path, self.block_size, self.fs, self.resample_quality, self.sample_dtype):
+            block = block.T if block.ndim > 1 else block[np.newaxis]
+            if downmix and len(block) > 1:
+                with stage('downmix'):
+                    block = mix_down(block)[np.newaxis]
+            buffer = block if buffer is None else np.concatenate([buffer, block], axis=-1)
+            if buffer.shape[-1] < nperseg:
+                continue
+
+            n_segments = (buffer.shape[-1] - nperseg) // hop + 1
+            segments = sliding_window_view(buffer, nperseg, axis=-1)[:, ::hop][:, :n_segments]
+            for first in range(0, n_segments, group):
+                yield segments[:, first:first + group]
+            count += n_segments
+            buffer = buffer[:, n_segments * hop:]
+
+        if buffer is None:
+            raise ValueError(f"{path}: no audio data")
+        if count == 0:
+            yield buffer[:, np.newaxis]
+
+    def spectrogram(self, path, hop_size=0.1, downmix=True, dtype=np.float16):
+        """
+        Short-time spectrum of the whole file: one window_size segment every
+        `hop_size` seconds, each scaled and smoothed exactly like
+        analyze_array, streamed block by block. Only the result is kept, cast
+        to `dtype` block by block, so with octave-band smoothing a multi-hour
+        file costs a few MB.
+
+        Returns (times, freq, dbfs): times are the segment centres in seconds,
+        dbfs is (segments, freq) with downmix, (channels, segments, freq) otherwise.
+        """
+        hop = max(1, int(round(hop_size * self.fs)))
+        cutoff = self.cutoff(path)
+        frames = [self.to_dbfs(self.magnitude(segments, cutoff)).astype(dtype)
+                  for segments in self.iter_segments(path, hop, downmix)]
+        dbfs = np.concatenate(frames, axis=1)
+        times = (np.arange(dbfs.shape[1]) * hop + self.window_samples / 2) / self.fs
+        return times, self.freq, dbfs[0] if downmix else dbfs
+
+
+@lru_cache(maxsize=8)
+def get_analyzer(**config):
+    """
+    Process-wide SpectrumAnalyzer for a given configuration, so that batch
+    workers build the cached arrays once and reuse them for every file.
+    """
+    with stage('setup'):
+        return SpectrumAnalyzer(**config)
+
+
+# Help of the options added by add_analysis_arguments; spectrum.py passes its own in Italian
+ANALYSIS_HELP = {
+    'second': 'Second at which to perform the analysis (default: 7)',
+    'window': 'Analysis window size in seconds (default: 5)',
+    'resample_quality': 'Resampler used for non-48kHz files: polyphase fast/default/best, or fft, the original '
+                        'whole-file FFT resample, which reads the whole file (default: default)',
+    'smoothing': 'Spectrum smoothing: 100-bin Gaussian, or average over 1/N-octave bands (default: %(default)s)',
+    'mode': 'single: one FFT of the window at --second; welch: average of --window segments over the whole file '
+            '(default: single)',
+    'overlap': 'Overlap between Welch segments, 0 to <1 (default: 0.5)',
+    'block': 'Seconds of audio read and transformed per block in Welch mode; memory is bounded by it (default: 30)',
+    'precision': 'Numeric precision of the analysis: float32 halves the memory and is faster, within 0.01 dB of '
+                 'float64 above -120 dBFS (default: float64)',
+    'cache_dir': 'Folder where computed spectra are cached between runs (default: %(default)s)',
+    'no_cache': 'Always recompute, without reading or writing the cache',
+    'cache_hash': 'Identify cached files by a SHA-256 of their content instead of path, size and mtime',
+}
+
+
+def add_analysis_arguments(parser, help=ANALYSIS_HELP, smoothing='gaussian', modes=True, cache=True):
+    """
+    The options shared by every spectrum command: --second and --window, then
+    the analyzer settings. The spectrogram, which streams every segment and
+    declares its own --window, leaves out the single/Welch options (`modes`)
+    and the cache, and smooths over 1/24 octave by default.
+    """
+    if modes:
+        parser.add_argument('--second', type=float, default=7, help=help['second'])
+        parser.add_argument('--window', type=float, default=5, help=help['window'])
+    parser.add_argument('--resample-quality', choices=list(RESAMPLE_QUALITY), default='default',
+                        help=help['resample_quality'])
+    parser.add_argument('--smoothing', choices=SMOOTHING_CHOICES, default=smoothing, help=help['smoothing'])
+    if modes:
+        parser.add_argument('--mode', choices=MODES, default='single', help=help['mode'])
+        parser.add_argument('--overlap', type=float, default=0.5, help=help['overlap'])
+    parser.add_argument('--block', type=float, default=30, help=help['block'])
+    parser.add_argument('--precision', choices=PRECISIONS, default='float64', help=help['precision'])
+    if cache:
+        parser.add_argument('--cache-dir', type=str, default=default_cache_dir(), help=help['cache_dir'])
+        parser.add_argument('--no-cache', action='store_true', help=help['no_cache'])
+        parser.add_argument('--cache-hash', action='store_true', help=help['cache_hash'])
+
+
+def analyzer_options(args):
+    """The SpectrumAnalyzer keyword arguments set by the options of add_analysis_arguments."""
+    options = dict(resample_quality=args.resample_quality, octave_fraction=parse_smoothing(args.smoothing),
+                   block_size=args.block, precision=args.precision)
+    if 'mode' in vars(args):
+        options.update(mode=args.mode, overlap=args.overlap)
+    if 'cache_dir' in vars(args):
+        options.update(cache_dir=None if args.no_cache else args.cache_dir, cache_hash=args.cache_hash)
+    return options
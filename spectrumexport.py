@@ -0,0 +1,95 @@
+import csv
+import json
+import numpy as np
+from plotting import IMAGE_FORMATS
+from profiling import stage
+
+EXPORT_FORMATS = ['npz', 'csv', 'json']
+
+
+def log_grid(freq, points, f_min=20.0):
+    """`points` log-spaced frequencies from f_min (or the first non-zero bin) to the last bin of freq."""
+    f_min = max(f_min, freq[freq > 0][0])
+    return np.geomspace(f_min, freq[-1], points)
+
+
+def decimate_log(freq, dbfs, points, f_min=20.0):
+    """
+    Resample smoothed curves onto a log-spaced grid of `points` frequencies by
+    linear interpolation in log frequency, so an export has the same detail per
+    octave everywhere instead of hundreds of thousands of linear bins. dbfs is
+    1-D or (curves, bins).
+    """
+    grid = log_grid(freq, points, f_min)
+    log_grid_freq = np.log(grid)
+    log_freq = np.log(np.maximum(freq, np.finfo(float).tiny))
+    curves = np.atleast_2d(dbfs)
+    decimated = np.array([np.interp(log_grid_freq, log_freq, curve) for curve in curves])
+    return grid, decimated if np.ndim(dbfs) > 1 else decimated[0]
+
+
+def write_spectrum(path, freq, dbfs, names=None, export_format='npz'):
+    """
+    Write freq (Hz) and dbfs to `path` as npz, csv or json. dbfs is one curve
+    or (curves, bins), with `names` labelling the rows (channels, files).
+
+    - npz: arrays 'freq' and 'dbfs' as computed, plus 'names'
+    - csv: a 'freq_hz' column and one dBFS column per curve
+    - json: {"freq": [...], "names": [...], "dbfs": [[...], ...]}
+    """
+    curves = np.atleast_2d(dbfs)
+    if names is None:
+        names = ['dbfs'] if len(curves) == 1 else [f"dbfs_{i + 1}" for i in range(len(curves))]
+
+    if export_format == 'npz':
+        np.savez(path, freq=freq, dbfs=dbfs, names=np.array(names))
+    elif export_format == 'csv':
+        with open(path, 'w', newline='') as fid:
+            csv.writer(fid, lineterminator='\n').writerow(['freq_hz'] + list(names))
+            np.savetxt(fid, np.column_stack([freq, curves.T]), fmt=['%.6g'] + ['%.4f'] * len(curves), delimiter=',')
+    elif export_format == 'json':
+        with open(path, 'w') as fid:
+            json.dump({'freq': np.round(freq, 3).tolist(), 'names': list(names),
+                       'dbfs': np.round(curves, 4).tolist()}, fid)
+    else:
+        raise ValueError(f"Unknown export format '{export_format}', expected one of {EXPORT_FORMATS}")
+
+
+def export_spectrum(path, freq, dbfs, names=None, export_format='npz', points=None):
+    """write_spectrum, first decimating onto a log grid of `points` frequencies if given."""
+    with stage('export'):
+        if points:
+            freq, dbfs = decimate_log(freq, dbfs, points)
+        write_spectrum(path, freq, dbfs, names, export_format)
+
+
+# Help of the options added by add_output_arguments; spectrum.py passes its own in Italian
+OUTPUT_HELP = {
+    'dpi': 'DPI of the saved plots; lower it for quick previews (default: 300)',
+    'format': 'Image format of the plots; svg and pdf are vector and ignore --dpi for the curve (default: png)',
+    'export': 'Also write the frequencies and dBFS values of each file to the output folder in this format',
+    'export_points': 'Decimate exported curves onto this many log-spaced frequencies (default: every bin)',
+    'no_plot': 'Only write the --export files, without rendering plots',
+}
+
+
+def add_output_arguments(parser, help=OUTPUT_HELP, image_format=True):
+    """
+    The output options of the spectrum tools: --dpi, --format unless the
+    extension of the output file sets it, --export, --export-points and
+    --no-plot.
+    """
+    parser.add_argument('--dpi', type=int, default=300, help=help['dpi'])
+    if image_format:
+        parser.add_argument('--format', choices=IMAGE_FORMATS, default='png', help=help['format'])
+    parser.add_argument('--export', choices=EXPORT_FORMATS, help=help['export'])
+    parser.add_argument('--export-points', type=int, help=help['export_points'])
+    parser.add_argument('--no-plot', action='store_true', help=help['no_plot'])
+
+
+def output_options(args):
+    """The keyword arguments set by the options of add_output_arguments."""
+    options = dict(dpi=args.dpi, plot=not args.no_plot, export_format=args.export, export_points=args.export_points)
+    if 'format' in vars(args):
+        options['image_format'] = args.format
+    return options
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+from functools import partial
+import profiling
+from batch import add_batch_arguments
+from manifest import run_folder, run_or_watch, output_params
+from spectrumengine import add_analysis_arguments, analyzer_options
+from spectrumexport import add_output_arguments, output_options, OUTPUT_HELP
+
+
+def process_folder(func, tool, input_folder, output_folder, analysis_second=7, window_size=5, jobs=None, dpi=300,
+                   image_format='png', plot=True, export_format=None, export_points=None, incremental=False,
+                   watching=False, **analyzer_options):
+    """
+    Run a per-file spectrum tool over every WAV file of `input_folder`:
+    func(input_file, output_file, analysis_second, window_size, dpi,
+    export_file, export_format, export_points, **analyzer_options) writes
+    <name>.<image_format> and <name>.<export_format> into `output_folder`.
+    `tool` names the outputs in the manifest.
+
+    With `incremental` (implied by `watching`) only the files that are new or
+    changed since the last run, or whose settings changed, are processed, and
+    the outputs of deleted files are removed; see manifest.run_incremental.
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    tasks = []
+    files = {}
+    for file_name in sorted(os.listdir(input_folder)):
+        if file_name.lower().endswith('.wav'):
+            input_file = os.path.join(input_folder, file_name)
+            stem = os.path.join(output_folder, os.path.splitext(file_name)[0])
+            output_file = export_file = None
+            if plot:
+                output_file = f"{stem}.{image_format}"
+            if export_format:
+                export_file = f"{stem}.{export_format}"
+            tasks.append((file_name, (input_file, output_file, analysis_second, window_size, dpi,
+                                      export_file, export_format, export_points)))
+            files[file_name] = [input_file], [path for path in (output_file, export_file) if path]
+
+    params = output_params(tool=tool, analysis_second=analysis_second, window_size=window_size, dpi=dpi,
+                           image_format=image_format, plot=plot, export_format=export_format,
+                           export_points=export_points, **analyzer_options)
+    return run_folder(partial(func, **analyzer_options), tasks, files, output_folder, params, jobs,
+                      incremental=incremental, watching=watching)
+
+
+def main(tool, func, description, help=OUTPUT_HELP):
+    """The command line of a folder tool around process_folder; `help` is that of add_output_arguments."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('input_folder', type=str, help='Path to the input folder containing WAV files')
+    parser.add_argument('output_folder', type=str, help='Path to the output folder for saving PNG files')
+    add_analysis_arguments(parser)
+    add_output_arguments(parser, help)
+    add_batch_arguments(parser)
+    profiling.add_profile_arguments(parser)
+
+    args = parser.parse_args()
+    if args.no_plot and not args.export:
+        parser.error('--no-plot requires --export')
+    if args.profile:
+        profiling.enable(args.profile, args.profile_memory)
+    run = partial(process_folder, func, tool, args.input_folder, args.output_folder, args.second, args.window,
+                  args.jobs, incremental=args.incremental, **output_options(args), **analyzer_options(args))
+    failures = run_or_watch(run, args.watch, args.interval)
+    profiling.summary()
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,75 @@
+import argparse
+import csv
+import os
+import sys
+from functools import partial
+import profiling
+from batch import run_batch, add_batch_arguments
+from profiling import stage
+from stereoscope import stereo_field_metrics, load_stereo_segment, compute_mid_side, render_stereoscope
+
+def analyze_stereo_file(input_file, png_file=None, block_size=10, band_edges=(200, 2000),
+                        png_start=0, png_duration=5, dpi=300, render='auto'):
+    metrics = stereo_field_metrics(input_file, block_size, band_edges)
+    if png_file is not None:
+        y, _ = load_stereo_segment(input_file, png_start, png_duration)
+        with stage('mid_side'):
+            mid, side, stats = compute_mid_side(y)
+        render_stereoscope(mid, side, stats['mid_percentage'], png_file, dpi=dpi, render=render)
+        print(f"Stereoscope saved to {png_file}")
+    return metrics
+
+def process_directory(input_folder, output_table, png_folder=None, jobs=None, **options):
+    tasks = []
+    for file_name in sorted(os.listdir(input_folder)):
+        if file_name.lower().endswith('.wav'):
+            input_file = os.path.join(input_folder, file_name)
+            png_file = None
+            if png_folder is not None:
+                png_file = os.path.join(png_folder, os.path.splitext(file_name)[0] + '.png')
+            tasks.append((file_name, (input_file, png_file)))
+
+    if png_folder is not None and not os.path.exists(png_folder):
+        os.makedirs(png_folder)
+    output_dir = os.path.dirname(output_table)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    results = []
+    failures = run_batch(partial(analyze_stereo_file, **options), tasks, jobs, results=results)
+
+    if results:
+        columns = ['file'] + list(results[0][1])
+        with open(output_table, 'w', newline='') as fid:
+            writer = csv.DictWriter(fid, fieldnames=columns)
+            writer.writeheader()
+            for name, metrics in results:
+                writer.writerow({'file': name, **metrics})
+        print(f"Metrics for {len(results)} files written to {output_table}")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compute stereo field metrics for all WAV files in a folder')
+    parser.add_argument('input_folder', type=str, help='Path to the input folder containing WAV files')
+    parser.add_argument('output_table', type=str, help='Path of the CSV file with one row of metrics per WAV file')
+    parser.add_argument('--png-folder', type=str, help='Also render a stereoscope PNG per file into this folder')
+    parser.add_argument('--png-start', type=float, default=0, help='Start of the excerpt rendered in the PNG, in seconds (default: 0)')
+    parser.add_argument('--png-duration', type=float, default=5, help='Length of the excerpt rendered in the PNG, in seconds (default: 5)')
+    parser.add_argument('--dpi', type=int, default=300, help='DPI for the PNG files (default: 300)')
+    parser.add_argument('--render', choices=['auto', 'scatter', 'density'], default='auto',
+                        help='Stereoscope render mode for the PNG files (default: auto)')
+    parser.add_argument('--bands', type=str, default='200,2000',
+                        help='Comma-separated band edges in Hz for the per-band stereo width (default: 200,2000)')
+    parser.add_argument('--block', type=float, default=10, help='Seconds of audio read per block (default: 10)')
+    add_batch_arguments(parser, incremental=False)
+    profiling.add_profile_arguments(parser)
+
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable(args.profile, args.profile_memory)
+    band_edges = tuple(sorted(float(edge) for edge in args.bands.split(',') if edge.strip()))
+    failures = process_directory(args.input_folder, args.output_table, args.png_folder, args.jobs,
+                                 block_size=args.block, band_edges=band_edges, png_start=args.png_start,
+                                 png_duration=args.png_duration, dpi=args.dpi, render=args.render)
+    profiling.summary()
+    sys.exit(1 if failures else 0)
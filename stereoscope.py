@@ -1,8 +1,221 @@
 import numpy as np
-import librosa
-import matplotlib.pyplot as plt
+import os
 import sys
 import argparse
+import profiling
+from profiling import stage
+from wavsegment import read_wav_info, read_wav_frames, normalize_signal
+
+# Above this many samples the marker scatter gets slow (minutes at 300 dpi), use the density image
+SCATTER_MAX_SAMPLES = 200000
+
+def load_stereo_segment(audio_file, start_time, duration):
+    """
+    Carica `duration` secondi da `start_time` come array (canali, campioni) in
+    [-1, 1] e restituisce (y, sr). I WAV vengono letti direttamente, decodificando
+    solo il tratto richiesto; librosa viene importato solo per gli altri formati.
+    """
+    try:
+        info = read_wav_info(audio_file)
+    except ValueError:
+        # Non è un WAV leggibile da qui (mp3, flac, ...): serve librosa
+        import librosa
+        with stage('read'):
+            y, sr = librosa.load(audio_file, sr=None, mono=False, offset=start_time, duration=duration)
+        return y, sr
+
+    start = int(np.round(start_time * info.fs))
+    stop = start + int(np.round(duration * info.fs))
+    with stage('read'):
+        frames = read_wav_frames(info, start, stop)
+    with stage('normalise'):
+        y = normalize_signal(frames)
+    return y.T if y.ndim > 1 else y, info.fs
+
+def compute_mid_side(y):
+    """
+    Calcola Mid/Side da un segnale stereo (canali, campioni) e le percentuali di
+    energia. Restituisce (mid, side, stats) con stats = {'mid_energy',
+    'side_energy', 'mid_percentage'}.
+    """
+    if y.ndim == 1 or len(y) < 2:
+        raise ValueError("Audio mono rilevato. Convertire in stereo per lo stereoscope.")
+
+    # Estrazione canali
+    left, right = y[0], y[1]
+
+    # Calcolo Mid/Side corretto
+    mid = (left + right) / 2  # Mid (mono)
+    side = (right - left) / 2  # Side (differenza). Negli stereoscopi la visualizzazione è invertita
+
+    # Calcolo percentuali energia
+    mid_energy = float(np.dot(mid, mid))
+    side_energy = float(np.dot(side, side))
+    total_energy = mid_energy + side_energy
+    mid_percentage = (mid_energy / total_energy) * 100 if total_energy > 0 else 0
+    return mid, side, {'mid_energy': mid_energy, 'side_energy': side_energy, 'mid_percentage': mid_percentage}
+
+def _iter_stereo_blocks(audio_file, block_size):
+    """Blocchi (canali, campioni) consecutivi di tutto il file e la frequenza di campionamento."""
+    try:
+        info = read_wav_info(audio_file)
+    except ValueError:
+        import librosa
+        with stage('read'):
+            y, sr = librosa.load(audio_file, sr=None, mono=False)
+        block = max(1, int(block_size * sr))
+        for start in range(0, y.shape[-1], block):
+            yield y[..., start:start + block], sr
+        return
+
+    block = max(1, int(block_size * info.fs))
+    for start in range(0, info.n_frames, block):
+        with stage('read'):
+            frames = read_wav_frames(info, start, start + block)
+        with stage('normalise'):
+            y = normalize_signal(frames)
+        yield (y.T if y.ndim > 1 else y), info.fs
+
+def stereo_field_metrics(audio_file, block_size=10, band_edges=(200, 2000)):
+    """
+    Metriche del campo stereo su tutta la traccia, letta a blocchi di
+    `block_size` secondi così che la memoria non dipenda dalla durata:
+    energia Mid/Side e percentuale di Mid, correlazione tra i canali
+    (-1 controfase, 0 scorrelati, +1 mono) e, per ogni banda delimitata da
+    `band_edges` (Hz), la percentuale di energia Side come misura di larghezza.
+    """
+    band_edges = list(band_edges)
+    sums = {'mid': 0.0, 'side': 0.0, 'll': 0.0, 'rr': 0.0, 'lr': 0.0}
+    band_mid = np.zeros(len(band_edges) + 1)
+    band_side = np.zeros(len(band_edges) + 1)
+    n_samples = 0
+    peak = 0.0
+    sr = None
+
+    for y, sr in _iter_stereo_blocks(audio_file, block_size):
+        with stage('metrics'):
+            mid, side, stats = compute_mid_side(y)
+            left, right = y[0], y[1]
+            sums['mid'] += stats['mid_energy']
+            sums['side'] += stats['side_energy']
+            sums['ll'] += float(np.dot(left, left))
+            sums['rr'] += float(np.dot(right, right))
+            sums['lr'] += float(np.dot(left, right))
+            peak = max(peak, float(np.max(np.abs(y[:2]))))
+            n_samples += y.shape[-1]
+
+        with stage('fft'):
+            # Energia per banda dallo spettro del blocco (Parseval): solo i rapporti contano
+            band = np.searchsorted(band_edges, np.fft.rfftfreq(y.shape[-1], d=1/sr), side='right')
+            band_mid += np.bincount(band, weights=np.abs(np.fft.rfft(mid)) ** 2, minlength=len(band_mid))
+            band_side += np.bincount(band, weights=np.abs(np.fft.rfft(side)) ** 2, minlength=len(band_side))
+
+    if sr is None:
+        raise ValueError(f"{audio_file}: nessun campione audio")
+
+    total = sums['mid'] + sums['side']
+    norm = np.sqrt(sums['ll'] * sums['rr'])
+    metrics = {
+        'sample_rate': sr,
+        'duration': n_samples / sr,
+        'peak': peak,
+        'mid_energy': sums['mid'],
+        'side_energy': sums['side'],
+        'mid_percentage': sums['mid'] / total * 100 if total > 0 else 0,
+        'correlation': float(sums['lr'] / norm) if norm > 0 else 0,
+    }
+    lows = [0] + band_edges
+    highs = [f"{edge:g}" for edge in band_edges] + ['nyquist']
+    for low, high, m, s in zip(lows, highs, band_mid, band_side):
+        metrics[f"side_percentage_{low:g}_{high}"] = float(s / (m + s) * 100) if m + s > 0 else 0
+    return metrics
+
+def density_image(x, y, max_range, bins, gamma):
+    """
+    Count the (x, y) points in a bins x bins grid over [-max_range, max_range]
+    with one bincount, then tone map: log of the counts normalised to [0, 1],
+    raised to gamma. Row 0 is the bottom of the plot.
+    """
+    scale = bins / (2 * max_range)
+    ix = np.clip(((x + max_range) * scale).astype(np.intp), 0, bins - 1)
+    iy = np.clip(((y + max_range) * scale).astype(np.intp), 0, bins - 1)
+    counts = np.bincount(iy * bins + ix, minlength=bins * bins).reshape(bins, bins)
+    image = np.log1p(counts)
+    peak = image.max()
+    if peak > 0:
+        image /= peak
+    return image ** gamma
+
+def render_stereoscope(mid, side, mid_percentage, output_png, dpi=300, markersize=0.5, alpha=0.5,
+                       render='auto', bins=600, gamma=0.5, show=False):
+    """
+    Disegna lo stereoscope (Side sull'asse X, Mid sull'asse Y) con la barra della
+    percentuale di Mid e lo salva in `output_png`. plt.show() solo se `show`.
+    """
+    with stage('plot'):
+        import matplotlib.pyplot as plt
+        fig = _draw_stereoscope(plt, mid, side, mid_percentage, markersize, alpha, render, bins, gamma)
+    try:
+        with stage('savefig'):
+            fig.savefig(output_png, dpi=dpi)
+        if show:
+            plt.show()
+    finally:
+        plt.close(fig)
+
+def _draw_stereoscope(plt, mid, side, mid_percentage, markersize, alpha, render, bins, gamma):
+    """Crea la figura dello stereoscope, pronta da salvare."""
+    # Per il grafico, usiamo il formato standard
+    X = side  # Asse X rappresenta Side
+    Y = mid   # Asse Y rappresenta Mid
+
+    # Creazione finestra con due subplot
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(6, 5),
+                                  gridspec_kw={'width_ratios': [3, 0.3]})
+
+    # Imposta gli stessi limiti per assi X e Y per mantenere proporzioni
+    max_range = max(np.max(np.abs(X)), np.max(np.abs(Y)))
+    if max_range == 0:
+        max_range = 1.0  # Silenzio: evita limiti degeneri
+
+    if render == 'auto':
+        render = 'scatter' if len(X) <= SCATTER_MAX_SAMPLES else 'density'
+
+    # Grafico principale
+    if render == 'scatter':
+        ax1.plot(X, Y, '.', markersize=markersize, alpha=alpha, color='black')
+    else:
+        # Un'unica immagine: il tempo di rendering dipende dai pixel, non dal numero di campioni
+        ax1.imshow(density_image(X, Y, max_range, bins, gamma), cmap='gray_r', origin='lower',
+                   extent=(-max_range, max_range, -max_range, max_range), interpolation='nearest', vmin=0, vmax=1)
+    ax1.axhline(0, color='gray', linewidth=0.5)
+    ax1.axvline(0, color='gray', linewidth=0.5)
+    ax1.set_aspect('equal')  # Imposta aspetto quadrato
+    ax1.grid(True, linestyle='--', linewidth=0.5)
+
+    ax1.set_xlim(-max_range, max_range)
+    ax1.set_ylim(-max_range, max_range)
+
+    # Barra verticale in bianco e nero per rappresentare la percentuale di Mid
+    ax2.set_ylim(0, 100)
+    ax2.set_xlim(0, 1)
+
+    # Barra nera per Mid, il resto bianco
+    ax2.bar(0.5, 100, width=1, color='white', edgecolor='black')  # Sfondo bianco
+    ax2.bar(0.5, mid_percentage, width=1, color='black', edgecolor='black')  # Barra nera per Mid
+
+    # Etichetta percentuale in basso alla barra, dritta
+    ax2.text(0.5, -2, f"Mid: {mid_percentage:.1f}%", ha='center', va='top', color='black', fontweight='bold')
+
+    # Rimuovi etichette inutili
+    ax2.set_xticks([])
+    ax2.set_yticks([])
+    ax2.set_ylabel("")
+    ax2.set_xlabel("")
+    ax2.axis('Off')
+
+    plt.tight_layout()
+    return fig
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Generate stereoscope visualization from audio file.')
@@ -13,83 +226,52 @@ def parse_arguments():
     parser.add_argument('--dpi', type=int, default=300, help='DPI for output image (default: 300)')
     parser.add_argument('--markersize', type=float, default=0.5, help='Size of plot markers (default: 0.5)')
     parser.add_argument('--alpha', type=float, default=0.5, help='Alpha transparency of markers (default: 0.5)')
+    parser.add_argument('--render', choices=['auto', 'scatter', 'density'], default='auto',
+                        help='scatter: one marker per sample; density: 2-D histogram drawn as a single image; '
+                             f'auto: scatter up to {SCATTER_MAX_SAMPLES} samples, density above (default: auto)')
+    parser.add_argument('--bins', type=int, default=600, help='Density image resolution in bins per axis (default: 600)')
+    parser.add_argument('--gamma', type=float, default=0.5, help='Gamma applied after the log tone map of the density (default: 0.5)')
+    parser.add_argument('--show', action='store_true', help='Also open the plot in a window after saving it')
+    profiling.add_profile_arguments(parser)
     return parser.parse_args()
 
-# Parse arguments
-args = parse_arguments()
-
-# Caricamento audio
-try:
-    y, sr = librosa.load(args.audio_file, sr=None, mono=False, offset=args.start_time, duration=args.duration)
-except FileNotFoundError:
-    print(f"Errore: Il file audio '{args.audio_file}' non è stato trovato.")
-    sys.exit(1)
-except Exception as e:
-    print(f"Errore durante il caricamento dell'audio: {e}")
-    sys.exit(1)
-
-# Controllo canali
-if y.ndim == 1:
-    print("Audio mono rilevato. Convertire in stereo per lo stereoscope.")
-    sys.exit(1)
-
-# Estrazione canali
-left, right = y[0], y[1]
-
-# Calcolo Mid/Side corretto
-Mid = (left + right) / 2  # Mid (mono)
-Side = (right - left) / 2  # Side (differenza). Negli stereoscopi la visualizzazione è invertita
-
-# Per il grafico, usiamo il formato standard
-X = Side  # Asse X rappresenta Side
-Y = Mid   # Asse Y rappresenta Mid
-
-# Calcolo percentuali energia
-mid_energy = np.sum(Mid**2)
-side_energy = np.sum(Side**2)
-total_energy = mid_energy + side_energy
-mid_percentage = (mid_energy / total_energy) * 100 if total_energy > 0 else 0
-
-# Creazione finestra con due subplot
-fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(6, 5),
-                              gridspec_kw={'width_ratios': [3, 0.3]})
-
-# Grafico principale
-ax1.plot(X, Y, '.', markersize=args.markersize, alpha=args.alpha, color='black')
-ax1.axhline(0, color='gray', linewidth=0.5)
-ax1.axvline(0, color='gray', linewidth=0.5)
-ax1.set_aspect('equal')  # Imposta aspetto quadrato
-ax1.grid(True, linestyle='--', linewidth=0.5)
-
-# Imposta gli stessi limiti per assi X e Y per mantenere proporzioni
-max_range = max(np.max(np.abs(X)), np.max(np.abs(Y)))
-ax1.set_xlim(-max_range, max_range)
-ax1.set_ylim(-max_range, max_range)
-
-# Barra verticale in bianco e nero per rappresentare la percentuale di Mid
-ax2.set_ylim(0, 100)
-ax2.set_xlim(0, 1)
-
-# Barra nera per Mid, il resto bianco
-ax2.bar(0.5, 100, width=1, color='white', edgecolor='black')  # Sfondo bianco
-ax2.bar(0.5, mid_percentage, width=1, color='black', edgecolor='black')  # Barra nera per Mid
-
-# Etichetta percentuale in basso alla barra, dritta
-ax2.text(0.5, -2, f"Mid: {mid_percentage:.1f}%", ha='center', va='top', color='black', fontweight='bold')
-
-# Rimuovi etichette inutili
-ax2.set_xticks([])
-ax2.set_yticks([])
-ax2.set_ylabel("")
-ax2.set_xlabel("")
-ax2.axis('Off')
-
-plt.tight_layout()
-try:
-    plt.savefig(args.output_png, dpi=args.dpi)
-    print(f"Immagine salvata con successo: {args.output_png}")
-except Exception as e:
-    print(f"Errore durante il salvataggio dell'immagine: {e}")
-    sys.exit(1)
-
-plt.show()
+def main():
+    args = parse_arguments()
+    if args.profile:
+        profiling.enable(args.profile, args.profile_memory)
+    try:
+        with profiling.profile_file(os.path.basename(args.audio_file)):
+            stereoscope(args)
+    finally:
+        profiling.summary()
+
+def stereoscope(args):
+    # Caricamento audio
+    try:
+        y, sr = load_stereo_segment(args.audio_file, args.start_time, args.duration)
+    except FileNotFoundError:
+        print(f"Errore: Il file audio '{args.audio_file}' non è stato trovato.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Errore durante il caricamento dell'audio: {e}")
+        sys.exit(1)
+
+    # Controllo canali
+    try:
+        with stage('mid_side'):
+            mid, side, stats = compute_mid_side(y)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    try:
+        render_stereoscope(mid, side, stats['mid_percentage'], args.output_png, dpi=args.dpi,
+                           markersize=args.markersize, alpha=args.alpha, render=args.render,
+                           bins=args.bins, gamma=args.gamma, show=args.show)
+        print(f"Immagine salvata con successo: {args.output_png}")
+    except Exception as e:
+        print(f"Errore durante il salvataggio dell'immagine: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import json
+import os
+import time
+import pytest
+from manifest import Manifest, MANIFEST_NAME, run_incremental, output_params
+
+
+class Tool:
+    """A per-file task writing `<name>.out` that remembers what it processed and fails on request."""
+    def __init__(self):
+        self.processed = []
+        self.failing = set()
+
+    def __call__(self, input_file, output_file):
+        name = os.path.basename(input_file)
+        self.processed.append(name)
+        if name in self.failing:
+            raise ValueError(f"{name}: cannot read")
+        with open(output_file, 'w') as fid:
+            fid.write(name)
+
+
+@pytest.fixture
+def folders(tmp_path):
+    inputs, outputs = tmp_path / 'in', tmp_path / 'out'
+    inputs.mkdir()
+    outputs.mkdir()
+    for name in ('a.wav', 'b.wav', 'c.wav'):
+        (inputs / name).write_text(name)
+    return str(inputs), str(outputs)
+
+
+def run(tool, folders, params=None, watching=False):
+    inputs, outputs = folders
+    tasks, files = [], {}
+    for name in sorted(os.listdir(inputs)):
+        input_file = os.path.join(inputs, name)
+        output_file = os.path.join(outputs, f"{os.path.splitext(name)[0]}.out")
+        tasks.append((name, (input_file, output_file)))
+        files[name] = [input_file], [output_file]
+    tool.processed.clear()
+    return run_incremental(tool, tasks, files, outputs, params or {'dpi': 300}, jobs=1, watching=watching)
+
+
+def age(path, seconds=60):
+    """Move the mtime of `path` into the past, clear of the watch settle time and of the previous mtime."""
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def change(path):
+    """Append to `path`, with an mtime old enough for a watching run to take it."""
+    with open(path, 'a') as fid:
+        fid.write('+')
+    age(path)
+
+
+def test_unchanged_files_are_skipped(folders):
+    tool = Tool()
+    assert run(tool, folders) == []
+    assert tool.processed == ['a.wav', 'b.wav', 'c.wav']
+    run(tool, folders)
+    assert tool.processed == []
+
+
+def test_changed_inputs_missing_outputs_and_settings_are_reprocessed(folders):
+    inputs, outputs = folders
+    tool = Tool()
+    run(tool, folders)
+    with open(os.path.join(inputs, 'a.wav'), 'a') as fid:
+        fid.write('more')
+    os.remove(os.path.join(outputs, 'b.out'))
+    run(tool, folders)
+    assert tool.processed == ['a.wav', 'b.wav']
+    run(tool, folders, params={'dpi': 100})
+    assert tool.processed == ['a.wav', 'b.wav', 'c.wav']
+
+
+def test_touched_input_is_skipped(folders):
+    inputs, outputs = folders
+    tool = Tool()
+    run(tool, folders)
+    age(os.path.join(inputs, 'a.wav'))
+    run(tool, folders)
+    assert tool.processed == []
+    # Same size, another content
+    with open(os.path.join(inputs, 'a.wav'), 'w') as fid:
+        fid.write('A.WAV')
+    age(os.path.join(inputs, 'a.wav'))
+    run(tool, folders)
+    assert tool.processed == ['a.wav']
+    assert 'sha256' in Manifest(outputs).entries['a.wav']['inputs'][os.path.join(inputs, 'a.wav')]
+
+
+def test_deleted_inputs_are_pruned_with_their_outputs(folders):
+    inputs, outputs = folders
+    tool = Tool()
+    run(tool, folders)
+    os.remove(os.path.join(inputs, 'b.wav'))
+    run(tool, folders)
+    assert tool.processed == []
+    assert sorted(os.listdir(outputs)) == [MANIFEST_NAME, 'a.out', 'c.out']
+    assert sorted(Manifest(outputs).entries) == ['a.wav', 'c.wav']
+
+
+def test_failed_tasks_keep_no_output_and_are_retried(folders):
+    inputs, outputs = folders
+    tool = Tool()
+    run(tool, folders)
+    tool.failing.add('b.wav')
+    change(os.path.join(inputs, 'b.wav'))
+    failures = run(tool, folders)
+    assert [name for name, _ in failures] == ['b.wav']
+    # The plot of the previous run must not pass for a result
+    assert not os.path.exists(os.path.join(outputs, 'b.out'))
+    assert Manifest(outputs).entries['b.wav']['failed']
+
+    # Retried on every run, but not on every poll while watching
+    run(tool, folders)
+    assert tool.processed == ['b.wav']
+    run(tool, folders, watching=True)
+    assert tool.processed == []
+    tool.failing.clear()
+    change(os.path.join(inputs, 'b.wav'))
+    assert run(tool, folders, watching=True) == []
+    assert tool.processed == ['b.wav']
+    assert os.path.exists(os.path.join(outputs, 'b.out'))
+
+
+def test_watching_waits_for_inputs_still_being_written(folders):
+    inputs, _ = folders
+    tool = Tool()
+    for name in os.listdir(inputs):
+        age(os.path.join(inputs, name))
+    open(os.path.join(inputs, 'd.wav'), 'w').close()
+    run(tool, folders, watching=True)
+    assert tool.processed == ['a.wav', 'b.wav', 'c.wav']
+
+
+def test_outputs_no_longer_written_are_removed(folders):
+    inputs, outputs = folders
+    manifest = Manifest(outputs)
+    input_file = os.path.join(inputs, 'a.wav')
+    plot, export = os.path.join(outputs, 'a.png'), os.path.join(outputs, 'a.csv')
+    for path in (plot, export):
+        open(path, 'w').close()
+    manifest.record('a.wav', [input_file], [plot, export], {})
+    manifest.record('a.wav', [input_file], [export], {'plot': False})
+    assert not os.path.exists(plot) and os.path.exists(export)
+    manifest.save()
+    with open(os.path.join(outputs, MANIFEST_NAME)) as fid:
+        assert json.load(fid)['entries']['a.wav']['outputs'] == ['a.csv']
+
+
+def test_output_params_ignore_the_cache_options():
+    assert output_params(dpi=300, cache_dir='/tmp/cache', cache_hash=True) == {'dpi': 300}
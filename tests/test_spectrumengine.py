@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from wavfiles import write_wav, noise
+from spectrumengine import SpectrumAnalyzer
+
+
+@pytest.fixture(scope='module')
+def noise_files(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('engine')
+    paths = {}
+    for fs in (44100, 48000):
+        paths[fs] = str(folder / f"noise{fs}.wav")
+        write_wav(paths[fs], (noise(3 * fs) * 32767).astype(np.int16), fs, 16)
+    return paths
+
+
+def welch(path, **options):
+    analyzer = SpectrumAnalyzer(window_size=0.2, mode='welch', **options)
+    return analyzer.analyze(path, downmix=False)[1]
+
+
+@pytest.mark.parametrize('fs', [44100, 48000])
+@pytest.mark.parametrize('overlap', [0, 0.5, 0.9])
+def test_welch_does_not_depend_on_the_block_size(noise_files, fs, overlap):
+    # Blocks shorter than a segment, not a multiple of the hop, and longer than the file
+    expected = welch(noise_files[fs], overlap=overlap, block_size=30)
+    for block_size in (0.07, 0.33, 1):
+        np.testing.assert_allclose(welch(noise_files[fs], overlap=overlap, block_size=block_size), expected,
+                                   rtol=0, atol=1e-9)
+
+
+def test_spectrogram_does_not_depend_on_the_block_size(noise_files):
+    analyzer = SpectrumAnalyzer(window_size=0.1, octave_fraction=6, block_size=30)
+    times, _, expected = analyzer.spectrogram(noise_files[44100], hop_size=0.05, dtype=np.float64)
+    analyzer = SpectrumAnalyzer(window_size=0.1, octave_fraction=6, block_size=0.26)
+    _, _, dbfs = analyzer.spectrogram(noise_files[44100], hop_size=0.05, dtype=np.float64)
+    assert len(times) == len(expected) == 59
+    np.testing.assert_allclose(dbfs, expected, rtol=0, atol=1e-9)
+
+
+def test_full_scale_sine_reads_0_dbfs():
+    analyzer = SpectrumAnalyzer(smoothing_sigma=0)
+    t = np.arange(analyzer.window_samples) / analyzer.fs
+    # An exact bin frequency, so the whole tone lands in one bin
+    tone = analyzer.fft_freq[1000]
+    _, dbfs = analyzer.analyze_array(np.sin(2 * np.pi * tone * t))
+    # Within the gain of the symmetric Hann window over its periodic one
+    assert abs(dbfs.max()) < 1e-3
+    assert np.argmax(dbfs) == 1000
+
+
+def test_bins_above_the_source_nyquist_frequency_are_floored(noise_files):
+    analyzer = SpectrumAnalyzer(window_size=1, analysis_second=0, smoothing_sigma=0)
+    _, dbfs = analyzer.analyze(noise_files[44100])
+    above = analyzer.fft_freq > 22050
+    assert np.all(dbfs[above] == -200)
+    assert np.all(dbfs[~above & (analyzer.fft_freq > 20)] > -200)
+
+
+def test_unknown_settings_are_rejected():
+    with pytest.raises(ValueError, match='Unknown resample quality'):
+        SpectrumAnalyzer(resample_quality='sinc')
+    with pytest.raises(ValueError, match='Unknown mode'):
+        SpectrumAnalyzer(mode='median')
+    with pytest.raises(ValueError, match='overlap'):
+        SpectrumAnalyzer(overlap=1)
@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+from scipy import signal as sg
+from scipy.io import wavfile
+from wavfiles import write_wav, noise
+from wavsegment import (read_wav_info, read_wav_frames, read_resampled, iter_wav_blocks, normalize_signal,
+                        resampled_length, _resample_filter)
+
+FS = 44100
+FRAMES = 3000
+
+
+def pcm(bits, channels=2):
+    """Integer samples covering the whole range of `bits`, 24-bit as the left-justified int32 wavfile returns."""
+    rng = np.random.default_rng(bits)
+    if bits == 8:
+        return rng.integers(0, 256, (FRAMES, channels)).astype(np.uint8)
+    if bits == 24:
+        return rng.integers(-2 ** 23, 2 ** 23, (FRAMES, channels)).astype(np.int32) << 8
+    info = np.iinfo(f'int{bits}')
+    return rng.integers(info.min, info.max, (FRAMES, channels), endpoint=True).astype(f'int{bits}')
+
+
+CASES = {
+    'pcm8': (pcm(8), 8, 'RIFF', False),
+    'pcm16': (pcm(16), 16, 'RIFF', False),
+    'pcm24': (pcm(24), 24, 'RIFF', False),
+    'pcm32': (pcm(32), 32, 'RIFF', False),
+    'float32': (noise(FRAMES).astype(np.float32), 32, 'RIFF', False),
+    'float64': (noise(FRAMES), 64, 'RIFF', False),
+    'mono16': (pcm(16, channels=1)[:, 0], 16, 'RIFF', False),
+    'rifx16': (pcm(16), 16, 'RIFX', False),
+    'rifx24': (pcm(24), 24, 'RIFX', False),
+    'extensible24': (pcm(24, channels=6), 24, 'RIFF', True),
+    'extensible_float32': (noise(FRAMES).astype(np.float32), 32, 'RIFF', True),
+    'rf64': (pcm(16), 16, 'RF64', False),
+}
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_reader_matches_wavfile(tmp_path, case):
+    samples, bits, container, extensible = CASES[case]
+    path = str(tmp_path / f"{case}.wav")
+    write_wav(path, samples, FS, bits, container, extensible)
+
+    info = read_wav_info(path)
+    assert (info.fs, info.n_frames, info.channels) == (FS, FRAMES, 1 if samples.ndim == 1 else samples.shape[1])
+    frames = read_wav_frames(info, 0, info.n_frames)
+    assert frames.dtype == info.dtype
+    np.testing.assert_array_equal(frames, samples)
+    _, expected = wavfile.read(path)
+    # wavfile keeps RIFX data big-endian, the reader returns native order
+    assert frames.dtype == expected.dtype.newbyteorder('=')
+    np.testing.assert_array_equal(frames, expected)
+    # Only the requested range, clipped to the file
+    np.testing.assert_array_equal(read_wav_frames(info, 1234, 2345), samples[1234:2345])
+    np.testing.assert_array_equal(read_wav_frames(info, FRAMES - 10, FRAMES + 10), samples[-10:])
+
+
+def test_truncated_file_yields_what_is_there(tmp_path):
+    path = str(tmp_path / 'truncated.wav')
+    samples = pcm(16)
+    write_wav(path, samples, FS, 16)
+    with open(path, 'r+b') as fid:
+        fid.truncate(fid.seek(0, 2) - 4 * 100 - 2)
+    info = read_wav_info(path)
+    assert info.n_frames == FRAMES - 101
+    np.testing.assert_array_equal(read_wav_frames(info, 0, FRAMES), samples[:FRAMES - 101])
+
+
+def test_not_a_wav_file(tmp_path):
+    path = tmp_path / 'bad.wav'
+    path.write_bytes(b'not audio at all')
+    with pytest.raises(ValueError, match='no RIFF header'):
+        read_wav_info(str(path))
+
+
+@pytest.mark.parametrize('dtype', [np.int16, np.int32])
+def test_normalize_scales_to_unit_range(dtype):
+    info = np.iinfo(dtype)
+    signal = np.array([info.min, 0, info.max], dtype=dtype)
+    np.testing.assert_array_equal(normalize_signal(signal), [-1.0, 0.0, info.max / -float(info.min)])
+    assert normalize_signal(signal, np.float32).dtype == np.float32
+
+
+def test_normalize_centres_8_bit_pcm():
+    signal = np.array([0, 128, 255], dtype=np.uint8)
+    np.testing.assert_array_equal(normalize_signal(signal), [-1.0, 0.0, 127 / 128])
+    np.testing.assert_array_equal(normalize_signal(signal, np.float32), np.float32([-1.0, 0.0, 127 / 128]))
+
+
+@pytest.fixture(scope='module')
+def resample_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('resample') / 'noise.wav')
+    write_wav(path, (noise(FS) * 32767).astype(np.int16), FS, 16)
+    return path
+
+
+@pytest.mark.parametrize('quality', ['fast', 'default', 'best'])
+@pytest.mark.parametrize('start, stop', [(0, 4800), (12345, 23456), (40000, 48000)])
+def test_read_resampled_matches_whole_file(resample_file, quality, start, stop):
+    info = read_wav_info(resample_file)
+    whole = normalize_signal(read_wav_frames(info, 0, info.n_frames))
+    expected = sg.resample_poly(whole, 160, 147, axis=0, window=_resample_filter(160, 147, quality))
+    assert resampled_length(info, 48000) == 48000
+    segment = read_resampled(info, start, stop, 48000, quality)
+    np.testing.assert_allclose(segment, expected[start:stop], rtol=0, atol=1e-12)
+
+
+def test_read_resampled_fft_slices_the_whole_file_resample(resample_file):
+    info = read_wav_info(resample_file)
+    whole = normalize_signal(read_wav_frames(info, 0, info.n_frames))
+    expected = sg.resample(whole, 48000, axis=0)
+    np.testing.assert_allclose(read_resampled(info, 1000, 2000, 48000, 'fft'), expected[1000:2000], atol=1e-12)
+    blocks = np.concatenate(list(iter_wav_blocks(resample_file, 0.3, 48000, 'fft')))
+    np.testing.assert_allclose(blocks, expected, atol=1e-12)
+
+
+def test_unknown_quality_is_rejected(resample_file):
+    info = read_wav_info(resample_file)
+    with pytest.raises(ValueError, match='Unknown resample quality'):
+        read_resampled(info, 0, 100, 48000, 'sinc')
+    with pytest.raises(ValueError, match='Unknown resample quality'):
+        next(iter_wav_blocks(resample_file, 1, 48000, 'sinc'))
+
+
+def test_blocks_join_into_the_whole_file(resample_file):
+    info = read_wav_info(resample_file)
+    whole = np.concatenate(list(iter_wav_blocks(resample_file, 1, 48000, 'default')))
+    np.testing.assert_allclose(whole, read_resampled(info, 0, 48000, 48000, 'default'), atol=1e-12)
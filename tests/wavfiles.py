@@ -0,0 +1,59 @@
+import struct
+import numpy as np
+
+# Tail of the KSDATAFORMAT_SUBTYPE GUIDs; the first two bytes are the format tag
+GUID_TAIL = b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+
+
+def encode_samples(samples, bits, big_endian=False):
+    """Sample bytes of `samples` (frames[, channels]) at `bits` per sample; 24-bit from left-justified int32 values."""
+    order = '>' if big_endian else '<'
+    flat = np.ascontiguousarray(samples).reshape(-1)
+    if bits == 24:
+        raw = flat.astype('<i4').view(np.uint8).reshape(-1, 4)[:, 1:]
+        return (raw[:, ::-1] if big_endian else raw).tobytes()
+    if flat.dtype.kind == 'f':
+        return flat.astype(f'{order}f{bits // 8}').tobytes()
+    if bits == 8:
+        return flat.astype(np.uint8).tobytes()
+    return flat.astype(f'{order}i{bits // 8}').tobytes()
+
+
+def write_wav(path, samples, fs, bits, container='RIFF', extensible=False):
+    """
+    Write `samples` (1-D or (frames, channels), integers or floats) as a WAV
+    file in one of the layouts read_wav_info handles: little-endian RIFF,
+    big-endian RIFX, RF64 with a ds64 chunk, and WAVE_FORMAT_EXTENSIBLE.
+    """
+    samples = np.asarray(samples)
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    big_endian = container == 'RIFX'
+    order = '>' if big_endian else '<'
+    format_tag = 3 if samples.dtype.kind == 'f' else 1
+    block_align = channels * bits // 8
+    data = encode_samples(samples, bits, big_endian)
+
+    fmt = struct.pack(order + 'HHIIHH', 0xFFFE if extensible else format_tag, channels, fs,
+                      fs * block_align, block_align, bits)
+    if extensible:
+        fmt += struct.pack(order + 'HHI', 22, bits, 0) + struct.pack(order + 'H', format_tag) + GUID_TAIL
+    chunks = b'fmt ' + struct.pack(order + 'I', len(fmt)) + fmt
+    # An odd-sized chunk before the data, which readers must skip with its pad byte
+    chunks += b'LIST' + struct.pack(order + 'I', 3) + b'abc\x00'
+
+    if container == 'RF64':
+        riff_size = 4 + 36 + len(chunks) + 8 + len(data)
+        ds64 = struct.pack('<QQQI', riff_size, len(data), len(samples), 0)
+        header = b'RF64' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE' + b'ds64' + struct.pack('<I', len(ds64)) + ds64
+        body = chunks + b'data' + struct.pack('<I', 0xFFFFFFFF) + data
+    else:
+        body = chunks + b'data' + struct.pack(order + 'I', len(data)) + data
+        header = container.encode() + struct.pack(order + 'I', 4 + len(body)) + b'WAVE'
+    with open(path, 'wb') as fid:
+        fid.write(header + body)
+
+
+def noise(frames, channels=2, seed=0):
+    """Gaussian noise at about -20 dBFS, (frames, channels) or 1-D with one channel."""
+    signal = np.random.default_rng(seed).normal(0, 0.1, (frames, channels))
+    return signal[:, 0] if channels == 1 else signal